@@ -1,12 +1,30 @@
 import streamlit as st, json, subprocess, os, re, sys, signal
 from datetime import datetime, timezone, timedelta
+from functools import lru_cache
+
+from pidfile import PID_PATH, read_pid, pid_alive
 
 st.set_page_config(page_title="気象庁ナウキャスト PNGタイル解析（APIキー不要）", page_icon="🌧️")
 
 # ───────────────────────────────────────────
-def load_config():
-    if os.path.exists("config.json"):
-        with open("config.json", encoding="utf-8") as f:
+# ログ解析用の正規表現（rerun ごとの再コンパイルを避ける）
+# 「[地点: ○○] MAX2x2: 現在 x.xmm/h(HH:MM), 15分後 ..., 30分後 ..., 60分後 ...」
+_RE_MAX2 = re.compile(r"\[地点:\s*([^\]]+)\].*MAX2x2:\s*(.+)$")
+_RE_PAIR = re.compile(r"(現在|15分後|30分後|60分後)\s+([0-9.]+)mm/h\((\d{2}:\d{2})\)")
+_RE_TS = re.compile(r"^\[([^\]]+)\]")
+_RE_DEBUG_IMG = re.compile(r"デバッグ画像:\s+(debug_images/\S+\.png)")
+
+# ───────────────────────────────────────────
+CONFIG_PATH = "config.json"
+LOG_PATH = "logs/monitor.log"
+LOG_VIEW_MAX_CHARS = 200_000  # ログ全文表示の既定上限（ブラウザへ送る量を抑える）
+
+
+@st.cache_data(show_spinner=False)
+def _load_config(mtime: float, path: str):
+    # mtime はキャッシュキー専用（ファイル更新時のみ再パース）
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
             cfg = json.load(f)
             # 後方互換: location -> locations への変換を毎回実行
             if "locations" not in cfg or not isinstance(cfg["locations"], list):
@@ -19,7 +37,7 @@ def load_config():
             return cfg
     return {
         "locations": [{"name": "三島駅", "lat": 35.126474871810345, "lon": 138.91109391000256}],
-        "monitoring": {"enabled": False, "interval_minutes": 3, "lead_minutes": 60},
+        "monitoring": {"enabled": False, "interval_minutes": 5, "lead_minutes": 60},
         "thresholds": {"heavy_rain": 30, "torrential_rain": 50},
         "notification": {"email_to": "", "enabled": True},
         "heartbeat": {"enabled": True, "times": ["09:00", "17:00"]},
@@ -27,9 +45,137 @@ def load_config():
     }
 
 
+def load_config():
+    # st.cache_data は呼び出しごとにコピーを返すため、戻り値を変更してもキャッシュは汚れない
+    mtime = os.path.getmtime(CONFIG_PATH) if os.path.exists(CONFIG_PATH) else 0.0
+    return _load_config(mtime, CONFIG_PATH)
+
+
 def save_config(cfg):
-    with open("config.json", "w", encoding="utf-8") as f:
-        json.dump(cfg, f, ensure_ascii=False, indent=2)
+    new = json.dumps(cfg, ensure_ascii=False, indent=2)
+    # 内容が変わらない場合は書き込まない（mtime を動かさずキャッシュも維持）
+    try:
+        with open(CONFIG_PATH, encoding="utf-8") as f:
+            if f.read() == new:
+                return
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+    # ワーカーが書きかけの config.json を読まないよう一時ファイル経由で置換
+    tmp = CONFIG_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(new)
+    os.replace(tmp, CONFIG_PATH)
+    # mtime の分解能が粗いFSでも確実に再読込させる
+    _load_config.clear()
+
+
+@st.cache_resource(show_spinner=False)
+def _monitor_module():
+    # requests/PIL を含む monitor の import はプロセスで1回だけ
+    import monitor
+    return monitor
+
+
+def _effective_interval(minutes):
+    """ワーカーの実際のチェック間隔（分）。計算は monitor.effective_interval_minutes をそのまま使う"""
+    try:
+        return _monitor_module().effective_interval_minutes(minutes)
+    except ImportError:
+        # monitor を import できない環境ではワーカーも動かないので、設定値をそのまま表示
+        return minutes
+
+
+def _tail_lines(path: str, n: int = 8192) -> list:
+    """ファイル末尾 n バイトだけを読み、行リストで返す（ログ全体を読まない）"""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        f.seek(max(0, size - n))
+        lines = f.read().decode("utf-8", "replace").splitlines()
+    # 途中から読んだ場合、先頭行は欠けている可能性があるので捨てる
+    if size > n and lines:
+        lines = lines[1:]
+    return lines
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _parse_status_log(mtime: float, path: str, names: tuple):
+    """ログ末尾から (最終更新, 地点別MAX2x2, 最新10行) を抽出する。
+    mtime をキーにするため、ログが更新されるまで全セッションで解析結果を共有する。
+    """
+    # 通常は直近数サイクル分（64KB）で全地点の最新行が拾える。
+    # 見つからない地点があるときだけ読む範囲を広げる
+    size = os.path.getsize(path)
+    wanted = set(names)
+    n = 64 * 1024
+    while True:
+        lines = _tail_lines(path, n)
+        # 「[地点: ○○] MAX2x2: 現在 x.xmm/h(HH:MM), 15分後 ..., 30分後 ..., 60分後 ...」
+        # の最新行だけを地点ごとに拾う（設定中の全地点が揃った時点で打ち切り）
+        location_max2 = {}
+        for ln in reversed(lines):
+            if "MAX2x2:" not in ln:
+                continue
+            m = _RE_MAX2.search(ln)
+            if m:
+                name = m.group(1).strip()
+                if name not in wanted:
+                    continue
+                if name not in location_max2:
+                    location_max2[name] = m.group(2).strip()
+                    if len(location_max2) >= len(wanted):
+                        break
+        if len(location_max2) >= len(wanted) or n >= size:
+            break
+        n *= 4
+
+    last_updated_raw = None
+    for line in reversed(lines):
+        m = _RE_TS.match(line)
+        if m:
+            last_updated_raw = m.group(1)
+            break
+
+    return last_updated_raw, location_max2, lines[-10:]
+
+
+def _parse_ts(s: str) -> datetime:
+    """ログの "YYYY-MM-DD HH:MM:SS" を固定位置スライスで解析（strptime より高速）"""
+    if len(s) != 19:
+        raise ValueError(f"unexpected timestamp: {s!r}")
+    return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                    int(s[11:13]), int(s[14:16]), int(s[17:19]))
+
+
+# ───────────── UI部品 ─────────────
+# 小さめのCSS（チップ/カード）。空白を詰めた1行で送る
+_CSS = "<style>" + " ".join("""
+.chip { padding:4px 10px; border-radius:999px; color:#fff; display:inline-block; font-size:12px; font-weight:700 }
+.card { border:1px solid #e5e7eb; border-radius:16px; padding:12px; margin-bottom:12px; background:#fff;
+        box-shadow:0 1px 3px rgba(0,0,0,.06) }
+.card .title { font-weight:700; margin-bottom:6px; }
+.card .meta  { font-size:14px; line-height:1.6 }
+.card .link  { font-size:14px; margin-top:6px }
+""".split()) + "</style>"
+
+
+# rerun ごとに同じ入力が繰り返されるためメモ化
+@lru_cache(maxsize=32)
+def chip(text, color="#0ea5e9"):
+    return f"<span class='chip' style='background:{color}'>{text}</span>"
+
+
+@lru_cache(maxsize=256)
+def severity_bg(v, heavy=30.0, torrential=50.0):
+    # 値に応じて背景色（やさしめ）を返す（ログ由来の値は小数1桁なのでキーは有界）
+    if v is None:
+        return "#f3f4f6"   # gray-100
+    if v >= torrential:
+        return "#fee2e2"   # red-100
+    if v >= heavy:
+        return "#fef3c7"   # amber-100
+    if v >= 1.0:
+        return "#e0f2fe"   # sky-100
+    return "#f3f4f6"       # gray-100
 
 
 # ───────────── UI ───────────────────────
@@ -46,48 +192,35 @@ with st.sidebar:
         "監視を有効化", value=cfg["monitoring"]["enabled"]
     )
 
-    # ワーカー管理ユーティリティ
-    PID_FILE = "monitor.pid"
-
-    def read_pid():
-        try:
-            with open(PID_FILE, "r") as f:
-                return int(f.read().strip())
-        except Exception:
-            return None
-
-    def is_alive(pid: int) -> bool:
-        if not pid:
-            return False
-        try:
-            os.kill(pid, 0)
-            return True
-        except Exception:
-            return False
-
+    # ワーカー管理ユーティリティ（PID ファイルの読込と生存確認は pidfile.py を monitor と共用）
     def is_worker_running() -> bool:
         pid = read_pid()
-        if pid and is_alive(pid):
+        if pid_alive(pid):
             return True
         # ステールPIDファイルを掃除
-        if os.path.exists(PID_FILE):
+        if os.path.exists(PID_PATH):
             try:
-                os.remove(PID_FILE)
+                os.remove(PID_PATH)
             except Exception:
                 pass
         return False
 
+    @st.cache_data(ttl=2, show_spinner=False)
+    def _worker_running_cached() -> bool:
+        # 連続する rerun では PID 読込と生存確認を数秒間使い回す
+        return is_worker_running()
+
     def start_worker():
         try:
-            DEVNULL = open(os.devnull, 'wb')
             subprocess.Popen(
                 [sys.executable, "monitor.py"],
-                stdout=DEVNULL, stderr=subprocess.STDOUT,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
                 start_new_session=True,
             )
             st.success("ワーカーを起動しました")
         except Exception as e:
             st.error(f"起動に失敗: {e}")
+        _worker_running_cached.clear()
 
     def stop_worker():
         pid = read_pid()
@@ -98,31 +231,43 @@ with st.sidebar:
             st.info("ワーカーに停止指示を送信")
         except Exception as e:
             st.warning(f"停止指示に失敗: {e}")
+        _worker_running_cached.clear()
 
     # ↓ ここを修正
     if cfg["monitoring"]["enabled"]:
         # 自動起動
-        if not is_worker_running():
+        if not _worker_running_cached():
             save_config(cfg)  # 設定を保存し、ワーカーが最新状態を読み込めるように
             start_worker()
         st.success("🟢 監視中")
     else:
         # 自動停止
-        if is_worker_running():
+        if _worker_running_cached():
             save_config(cfg)
             stop_worker()
         st.warning("🔴 停止中")
 
+    def run_check_once() -> bool:
+        try:
+            mon = _monitor_module()
+        except ImportError:
+            # import できない環境では従来どおり別プロセスで実行
+            res = subprocess.run([sys.executable, "monitor.py", "--once"])
+            return res.returncode == 0
+        return mon.run_once()
+
     st.divider()
     if st.button("🔍 今すぐチェック"):
         with st.spinner("データ取得中..."):
-            res = subprocess.run([sys.executable, "monitor.py", "--once"])
-            st.success("✅ 完了" if res.returncode == 0 else "❌ エラー")
+            ok = run_check_once()
+            st.success("✅ 完了" if ok else "❌ エラー")
 
     st.divider()
     st.subheader("⏰ 監視間隔")
+    # ワーカーはナウキャスト更新（5分ごと）に合わせて確認するため、間隔は5分単位
     cfg["monitoring"]["interval_minutes"] = st.slider(
-        "確認間隔（分）", 3, 30, cfg["monitoring"]["interval_minutes"]
+        "確認間隔（分）", 5, 30, min(30, max(5, int(_effective_interval(cfg["monitoring"]["interval_minutes"])))), step=5,
+        help="気象庁の更新（5分ごと）の直後に確認します",
     )
     st.info(f"1日あたり {24*60//cfg['monitoring']['interval_minutes']} 回")
 
@@ -146,31 +291,22 @@ with tab1:
     st.header("現在の監視状態")
 
     # ---- 小さめのCSS（チップ/カード）
-    st.markdown("""
-    <style>
-    .chip { padding:4px 10px; border-radius:999px; color:#fff; display:inline-block; font-size:12px; font-weight:700 }
-    .card { border:1px solid #e5e7eb; border-radius:16px; padding:12px; margin-bottom:12px; background:#fff;
-            box-shadow:0 1px 3px rgba(0,0,0,.06) }
-    .card .title { font-weight:700; margin-bottom:6px; }
-    .card .meta  { font-size:14px; line-height:1.6 }
-    </style>
-    """, unsafe_allow_html=True)
-
-    def chip(text, color="#0ea5e9"):
-        return f"<span class='chip' style='background:{color}'>{text}</span>"
+    # Streamlit は rerun で出力されなかった要素を消すため、毎回注入する（文字列は定数を再利用）
+    st.markdown(_CSS, unsafe_allow_html=True)
+
+    # ログ解析はこのタブで1回だけ行い、各セクションで共有する
+    has_log = os.path.exists(LOG_PATH)
+    if has_log:
+        last_updated_raw, location_max2, recent_lines = _parse_status_log(
+            os.path.getmtime(LOG_PATH), LOG_PATH,
+            tuple(loc.get("name") for loc in cfg.get("locations", [])),
+        )
+    else:
+        last_updated_raw, location_max2, recent_lines = None, {}, []
 
     # ---- 監視状態/KPI（参照オフセット・自動更新UIは無し）
     is_enabled   = bool(cfg.get("monitoring", {}).get("enabled", False))
-    interval_min = int(cfg.get("monitoring", {}).get("interval_minutes", 3))
-
-    # 最終更新（ログ最終行のタイムスタンプを短縮表示）
-    last_updated_raw = None
-    if os.path.exists("logs/monitor.log"):
-        with open("logs/monitor.log", encoding="utf-8") as f:
-            for line in reversed(f.read().splitlines()):
-                if line.startswith("[") and "]" in line:
-                    last_updated_raw = line.split("]")[0].lstrip("[")
-                    break
+    interval_min = _effective_interval(cfg.get("monitoring", {}).get("interval_minutes", 5))
 
     # KPI行：最終更新の列幅を少し広めにする
     c0, c1, c2, c3 = st.columns([1, 1, 1, 1.6])
@@ -179,10 +315,10 @@ with tab1:
     c1.metric("監視地点数", len(cfg.get("locations", [])))
     c2.metric("チェック間隔", f"{interval_min} 分")
 
-    # 最終更新は短い表記＋ヘルプにフル時刻
+    # 最終更新（ログ最終行のタイムスタンプ）は短い表記＋ヘルプにフル時刻
     if last_updated_raw:
         try:
-            ludt = datetime.strptime(last_updated_raw, "%Y-%m-%d %H:%M:%S")
+            ludt = _parse_ts(last_updated_raw)
             ludt = ludt.replace(tzinfo=timezone.utc).astimezone(timezone(timedelta(hours=9)))
             short_val = ludt.strftime("%m/%d %H:%M")        # 例: 08/11 14:35
             full_tip  = f"{ludt:%Y-%m-%d %H:%M:%S}"         # 例: 2025-08-11 14:35:42
@@ -199,70 +335,41 @@ with tab1:
     if not locs:
         st.info("監視地点が設定されていません。config.json の locations を追加してください。")
     else:
-        # 2列カードで一覧表示
-        cols = st.columns(2)
+        # 2列カードで一覧表示（列ごとにHTMLをまとめて1回で描画）
+        cards = []
         for i, loc in enumerate(locs):
-            with cols[i % 2]:
-                name = loc.get("name", f"地点{i+1}")
-                lat  = float(loc.get("lat", 0.0))
-                lon  = float(loc.get("lon", 0.0))
-                heavy = float(loc.get("heavy_rain",  cfg.get("thresholds", {}).get("heavy_rain", 30)))
-                torr  = float(loc.get("torrential_rain", cfg.get("thresholds", {}).get("torrential_rain", 50)))
-                notif_on = bool(loc.get("notification_enabled", True)) and bool(loc.get("email_to", ""))
-
-                notif_badge = chip("通知ON", "#16a34a") if notif_on else chip("通知OFF", "#6b7280")
-                jma_url = f"https://www.jma.go.jp/bosai/nowc/#zoom:10/lat:{lat}/lon:{lon}/colordepth:normal/elements:hrpns"
-
-                st.markdown(f"""
-                <div class="card">
-                  <div class="title">🌏 {name}</div>
-                  <div class="meta">
-                    <div>座標：{lat:.6f}, {lon:.6f}</div>
-                    <div>しきい値：大雨 {heavy:.0f} / 豪雨 {torr:.0f} mm/h</div>
-                    <div>通知：{notif_badge}</div>
-                  </div>
-                </div>
-                """, unsafe_allow_html=True)
-
-                # JMAの地図へ
-                try:
-                    st.link_button("地図で開く（JMA）", jma_url, use_container_width=True)
-                except Exception:
-                    st.markdown(f"<a href='{jma_url}' target='_blank'>地図で開く（JMA）</a>", unsafe_allow_html=True)
+            name = loc.get("name", f"地点{i+1}")
+            lat  = float(loc.get("lat", 0.0))
+            lon  = float(loc.get("lon", 0.0))
+            heavy = float(loc.get("heavy_rain",  cfg.get("thresholds", {}).get("heavy_rain", 30)))
+            torr  = float(loc.get("torrential_rain", cfg.get("thresholds", {}).get("torrential_rain", 50)))
+            notif_on = bool(loc.get("notification_enabled", True)) and bool(loc.get("email_to", ""))
+
+            notif_badge = chip("通知ON", "#16a34a") if notif_on else chip("通知OFF", "#6b7280")
+            jma_url = f"https://www.jma.go.jp/bosai/nowc/#zoom:10/lat:{lat}/lon:{lon}/colordepth:normal/elements:hrpns"
+
+            # JMAの地図へのリンクはカード内の <a> で描画
+            cards.append(f"""
+            <div class="card">
+              <div class="title">🌏 {name}</div>
+              <div class="meta">
+                <div>座標：{lat:.6f}, {lon:.6f}</div>
+                <div>しきい値：大雨 {heavy:.0f} / 豪雨 {torr:.0f} mm/h</div>
+                <div>通知：{notif_badge}</div>
+              </div>
+              <div class="link"><a href="{jma_url}" target="_blank">地図で開く（JMA）</a></div>
+            </div>""")
+
+        cols = st.columns(2)
+        for c, col in enumerate(cols):
+            if cards[c::2]:
+                col.markdown("".join(cards[c::2]), unsafe_allow_html=True)
 
     st.divider()
     st.subheader("⏱️ 短時間降水モニタ（代表：2×2最大）— 現在 / ＋15 / ＋30 / ＋60 分")
 
     # 各地点の最新降水量データ（ログ）を取得・表示（2×2最大のみ）
-    if os.path.exists("logs/monitor.log"):
-        import re
-        with open("logs/monitor.log", encoding="utf-8") as f:
-            lines = f.read().splitlines()
-
-        # 「[地点: ○○] MAX2x2: 現在 x.xmm/h(HH:MM), 15分後 ..., 30分後 ..., 60分後 ...」
-        # の最新行だけを地点ごとに拾う
-        location_max2 = {}
-        for ln in reversed(lines):
-            if "MAX2x2:" not in ln:
-                continue
-            m = re.search(r"\[地点:\s*([^\]]+)\].*MAX2x2:\s*(.+)$", ln)
-            if m:
-                name = m.group(1).strip()
-                if name not in location_max2:
-                    location_max2[name] = m.group(2).strip()
-
-        def severity_bg(v, heavy=30.0, torrential=50.0):
-            # 値に応じて背景色（やさしめ）を返す
-            if v is None:
-                return "#f3f4f6"   # gray-100
-            if v >= torrential:
-                return "#fee2e2"   # red-100
-            if v >= heavy:
-                return "#fef3c7"   # amber-100
-            if v >= 1.0:
-                return "#e0f2fe"   # sky-100
-            return "#f3f4f6"       # gray-100
-
+    if has_log:
         def card(container, label, val, tstr, heavy, torrential):
             bg = severity_bg(val, heavy, torrential)
             vtxt = "—" if val is None else f"{val:.1f} mm/h"
@@ -289,7 +396,7 @@ with tab1:
                 # 文字列をパースして {ラベル:(値,時刻)} を作る
                 raw = location_max2[name]
                 pairs = dict((lab, (None, "—")) for lab in order)
-                for lab, val, tstr in re.findall(r"(現在|15分後|30分後|60分後)\s+([0-9.]+)mm/h\((\d{2}:\d{2})\)", raw):
+                for lab, val, tstr in _RE_PAIR.findall(raw):
                     pairs[lab] = (float(val), tstr)
 
                 st.markdown(f"### 🌧️ {name}")
@@ -306,10 +413,9 @@ with tab1:
 
     st.divider()
     st.subheader("📝 最新ログ 10 行")
-    if os.path.exists("logs/monitor.log"):
-        with open("logs/monitor.log", encoding="utf-8") as f:
-            for line in reversed(f.readlines()[-10:]):
-                st.write(line.rstrip())
+    if has_log:
+        for line in reversed(recent_lines):
+            st.write(line.rstrip())
     else:
         st.info("ログなし")
 
@@ -425,14 +531,15 @@ with tab2:
 # ----- ログ -----
 with tab3:
     st.header("動作ログ")
-    if os.path.exists("logs/monitor.log"):
-        with open("logs/monitor.log", encoding="utf-8") as f:
+    if os.path.exists(LOG_PATH):
+        with open(LOG_PATH, encoding="utf-8") as f:
             log_txt = f.read()
         lines = log_txt.splitlines()
         col1, col2, col3 = st.columns(3)
         col1.metric("行数", len(lines))
-        col2.metric("警報", sum("警報" in ln for ln in lines))
-        col3.metric("エラー", sum("エラー" in ln for ln in lines))
+        # 件数は全文に対する str.count（C実装）で数える
+        col2.metric("警報", log_txt.count("警報"))
+        col3.metric("エラー", log_txt.count("エラー"))
 
         st.divider()
         # ログに出力されたデバッグ画像をプレビュー表示
@@ -440,7 +547,7 @@ with tab3:
         debug_paths = []
         try:
             for ln in reversed(lines):
-                m = re.search(r"デバッグ画像:\s+(debug_images/\S+\.png)", ln)
+                m = _RE_DEBUG_IMG.search(ln)
                 if not m:
                     continue
                 path = m.group(1)
@@ -468,9 +575,18 @@ with tab3:
             st.info("デバッグ画像はまだありません。")
 
         st.divider()
-        st.text_area("全文", log_txt, height=400)
+        show_full = st.checkbox("フル表示", value=False,
+                                help=f"既定では末尾 {LOG_VIEW_MAX_CHARS // 1000}K 文字のみ表示します")
+        if show_full or len(log_txt) <= LOG_VIEW_MAX_CHARS:
+            log_view = log_txt
+        else:
+            tail = log_txt[-LOG_VIEW_MAX_CHARS:]
+            # 行の途中から始まらないよう次の改行以降を表示
+            log_view = "…(省略)…\n" + tail[tail.find("\n") + 1:]
+        st.text_area("全文", log_view, height=400)
         if st.button("🗑️ ログをクリア"):
-            open("logs/monitor.log", "w").close()
+            open(LOG_PATH, "w").close()
+            _parse_status_log.clear()
             st.success("クリアしました")
     else:
         st.info("ログファイルなし")
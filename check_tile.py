@@ -4,41 +4,97 @@
 check_tile.py - 保存されたタイル画像を確認するツール
 """
 
+import io
 import os
 import sys
 import json
-import glob
-from io import BytesIO
+import functools
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from pathlib import Path
 
-import requests
 from PIL import Image
 import numpy as np
-import matplotlib.pyplot as plt
+# matplotlib / requests は重いので初回使用時に import する（_pyplot / _get_session）
 
-# α値→降水量変換表
-STEP_TO_MM = {a: a for a in range(1, 61)}
-STEP_TO_MM.update({61: 80, 62: 100, 63: 150, 64: 200, 65: 300})
+# α値→降水量変換表（uint8 のα値で直接索引できる 256 要素。未定義ステップは0）
+STEP_TO_MM_ARR = np.zeros(256, dtype=np.uint16)
+STEP_TO_MM_ARR[1:61] = np.arange(1, 61)
+STEP_TO_MM_ARR[61:66] = [80, 100, 150, 200, 300]
+
+# 後方互換の dict 版（外部から import される場合用）
+STEP_TO_MM = {a: int(STEP_TO_MM_ARR[a]) for a in range(1, 66)}
+
+# 目盛り線・カラーバーを描くか（--pretty で有効。既定は描画コストの低い簡易表示）
+PRETTY = False
+
+_plt = None
+_SESSION = None
+
+# ハイライト用 RGBA バッファ（タイル形状ごとに1つ確保して使い回す）
+_OVERLAY_CACHE = {}
+
+
+def _pyplot():
+    """matplotlib.pyplot を初回使用時に import して返す"""
+    global _plt
+    if _plt is None:
+        import matplotlib
+        # 画面の無い環境（Linux の SSH/CI 等）では GUI バックエンドを初期化しない
+        if sys.platform.startswith("linux") and not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+            matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        _plt = plt
+    return _plt
+
+
+def _get_session():
+    """JMAホストへの接続を使い回す共有セッション（連続ダウンロード時のTLSハンドシェイク削減）"""
+    global _SESSION
+    if _SESSION is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        _SESSION = requests.Session()
+        _SESSION.headers.update({"Connection": "keep-alive"})
+        _SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return _SESSION
+
+
+@functools.lru_cache(maxsize=1)
+def _load_config():
+    """config.json を1回だけ読み込む（無い/壊れている場合は None）"""
+    try:
+        with open('config.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
 
 
 def check_latest_image():
     """最新の保存画像を確認"""
     
-    # debug_imagesフォルダの画像を検索
-    pattern = "debug_images/tile_*.png"
-    files = glob.glob(pattern)
+    # debug_imagesフォルダの画像(tile_*.png)から最新のものを1回の走査で探す
+    try:
+        with os.scandir("debug_images") as it:
+            latest = max(
+                (e for e in it if e.name.startswith("tile_") and e.name.endswith(".png")),
+                key=lambda e: e.stat().st_ctime,
+                default=None,
+            )
+    except FileNotFoundError:
+        latest = None
     
-    if not files:
+    if latest is None:
         print("❌ デバッグ画像が見つかりません")
         print("   まず `python monitor.py --debug` を実行してください")
         return
     
-    # 最新のファイルを取得
-    latest_file = max(files, key=os.path.getctime)
+    latest_file = latest.path
     print(f"📁 確認ファイル: {latest_file}")
     
-    # 画像を開く
-    img = Image.open(latest_file)
+    # 画像を開く（PNG 固定なので形式の自動判別は PNG プラグインだけに絞る）
+    img = Image.open(latest_file, formats=["PNG"])
     print(f"📐 画像サイズ: {img.size}")
     print(f"🎨 画像モード: {img.mode}")
     
@@ -46,24 +102,29 @@ def check_latest_image():
         print("ℹ️ 画像を RGBA に変換して解析します（元モード: %s）" % img.mode)
         img = img.convert('RGBA')
     
-    # アルファチャンネルを確認
-    alpha = np.array(img.getchannel('A'))
+    # アルファチャンネルを確認（H×W×4 配列のビューとして取り出し、バンド分割のコピーを避ける）
+    rgba = np.asarray(img)
+    alpha = rgba[..., 3]
+    
+    # ヒストグラムを1パスで作り、統計も分布もここから求める
+    counts = np.bincount(alpha.ravel(), minlength=256)
+    present = np.nonzero(counts)[0]
+    nonzero = alpha.size - int(counts[0])
     
     print("\n📊 アルファチャンネル統計:")
-    print(f"  最小値: {alpha.min()}")
-    print(f"  最大値: {alpha.max()}")
-    print(f"  平均値: {alpha.mean():.2f}")
-    print(f"  非ゼロピクセル数: {np.count_nonzero(alpha)} / {alpha.size}")
-    print(f"  非ゼロピクセル率: {np.count_nonzero(alpha) / alpha.size * 100:.2f}%")
+    print(f"  最小値: {present[0]}")
+    print(f"  最大値: {present[-1]}")
+    print(f"  平均値: {(np.arange(counts.size) * counts).sum() / alpha.size:.2f}")
+    print(f"  非ゼロピクセル数: {nonzero} / {alpha.size}")
+    print(f"  非ゼロピクセル率: {nonzero / alpha.size * 100:.2f}%")
     
     # 降水量の分布を確認
-    non_zero = alpha[alpha > 0]
-    if len(non_zero) > 0:
+    unique_values = present[present > 0]
+    if len(unique_values) > 0:
         print("\n🌧️ 降水量分布:")
-        unique_values = np.unique(non_zero)
         for val in unique_values[:10]:  # 最初の10個まで表示
-            mm = STEP_TO_MM.get(int(val), 0)
-            count = np.sum(alpha == val)
+            mm = int(STEP_TO_MM_ARR[val])
+            count = counts[val]
             print(f"  ステップ {val:3d} → {mm:3d} mm/h : {count:5d} ピクセル")
         if len(unique_values) > 10:
             print(f"  ... 他 {len(unique_values)-10} 種類の値")
@@ -71,69 +132,98 @@ def check_latest_image():
         print("\n☀️ 降水なし（全ピクセルが0）")
     
     # 可視化
-    visualize_tile(img, alpha, latest_file)
-
-
-def visualize_tile(img, alpha, filename):
-    """タイル画像を可視化"""
-    
-    fig, axes = plt.subplots(2, 2, figsize=(12, 10))
-    
-    # 1. 元画像（RGB）
-    ax = axes[0, 0]
-    rgb = img.convert('RGB')
-    ax.imshow(rgb)
-    ax.set_title('元画像 (RGB)')
-    ax.grid(True, alpha=0.3)
-    
-    # 2. アルファチャンネル
-    ax = axes[0, 1]
-    im = ax.imshow(alpha, cmap='viridis', vmin=0, vmax=65)
-    ax.set_title('アルファチャンネル（降水強度）')
-    plt.colorbar(im, ax=ax, label='ステップ値')
-    ax.grid(True, alpha=0.3)
-    
-    # 3. 降水量マップ (mm/h)
-    ax = axes[1, 0]
-    # ステップ値を降水量に変換
-    rainfall = np.vectorize(lambda x: STEP_TO_MM.get(int(x), 0))(alpha)
-    im = ax.imshow(rainfall, cmap='Blues', vmin=0, vmax=50)
-    ax.set_title('降水量 (mm/h)')
-    plt.colorbar(im, ax=ax, label='mm/h')
-    ax.grid(True, alpha=0.3)
-    
-    # 4. 降水エリアのハイライト
-    ax = axes[1, 1]
-    # 降水がある場所を赤でマーク
-    highlight = np.zeros((*alpha.shape, 4))
-    highlight[alpha > 0] = [1, 0, 0, 0.5]  # 赤色、半透明
-    ax.imshow(rgb)
-    ax.imshow(highlight)
-    ax.set_title('降水エリア（赤色）')
-    ax.grid(True, alpha=0.3)
-    
-    # 三島駅の位置をマーク（config.jsonから読み込み）
-    try:
-        with open('config.json', 'r', encoding='utf-8') as f:
-            config = json.load(f)
+    visualize_tile(rgba, latest_file)
+
+
+def _reuse_figure(num, figsize):
+    """同じレイアウトの Figure を使い回す（連続解析時の生成/破棄コストを削減）"""
+    fig = _pyplot().figure(num=num, figsize=figsize)
+    fig.clf()
+    return fig
+
+
+def visualize_tile(rgba, filename):
+    """タイル画像を可視化（rgba は H×W×4 の uint8 配列）"""
+    
+    plt = _pyplot()
+    alpha = rgba[..., 3]
+    
+    rgb = rgba[..., :3]  # convert('RGB') せずビューで渡す
+    
+    if not alpha.any():
+        # 降水なしタイルは雨関連の3面がすべて空になるため、元画像の1面だけ描画
+        fig = _reuse_figure("tile_dry", (6, 5))
+        ax = fig.subplots(1, 1)
+        axes = np.array([ax])
+        ax.imshow(rgb)
+        ax.set_title('元画像 (RGB) — 降水なし')
+        if PRETTY:
+            ax.grid(True, alpha=0.3)
+    else:
+        fig = _reuse_figure("tile_rain", (12, 10))
+        axes = fig.subplots(2, 2)
+        
+        # 1. 元画像（RGB）
+        ax = axes[0, 0]
+        ax.imshow(rgb)
+        ax.set_title('元画像 (RGB)')
+        if PRETTY:
+            ax.grid(True, alpha=0.3)
+        
+        # 2. アルファチャンネル
+        ax = axes[0, 1]
+        im = ax.imshow(alpha, cmap='viridis', vmin=0, vmax=65)
+        ax.set_title('アルファチャンネル（降水強度）')
+        if PRETTY:
+            plt.colorbar(im, ax=ax, label='ステップ値')
+            ax.grid(True, alpha=0.3)
+        
+        # 3. 降水量マップ (mm/h)
+        ax = axes[1, 0]
+        # ステップ値を降水量に変換
+        rainfall = STEP_TO_MM_ARR[alpha]
+        im = ax.imshow(rainfall, cmap='Blues', vmin=0, vmax=50)
+        ax.set_title('降水量 (mm/h)')
+        if PRETTY:
+            plt.colorbar(im, ax=ax, label='mm/h')
+            ax.grid(True, alpha=0.3)
         
+        # 4. 降水エリアのハイライト
+        ax = axes[1, 1]
+        # 降水がある場所を赤でマーク（uint8 RGBA。赤は確保時に塗り、毎回αだけ書き換える）
+        highlight = _OVERLAY_CACHE.get(alpha.shape)
+        if highlight is None:
+            highlight = _OVERLAY_CACHE[alpha.shape] = np.zeros((*alpha.shape, 4), dtype=np.uint8)
+            highlight[..., 0] = 255
+        np.multiply(alpha > 0, 128, out=highlight[..., 3], casting='unsafe')  # 赤色、半透明
+        ax.imshow(rgb)
+        ax.imshow(highlight)
+        ax.set_title('降水エリア（赤色）')
+        if PRETTY:
+            ax.grid(True, alpha=0.3)
+    
+    # 三島駅の位置をマーク（config.json がある場合のみ）
+    if _load_config() is not None:
         # ピクセル位置を計算（monitor.pyと同じロジック）
         # ここでは簡易的に中心点をマーク
         for ax in axes.flat:
             ax.plot(31, 42, 'r*', markersize=15, label='三島駅')
             ax.legend()
-    except:
-        pass
     
     plt.suptitle(f'タイル画像解析: {os.path.basename(filename)}', fontsize=14)
     plt.tight_layout()
     
     # 保存
-    output_file = filename.replace('.png', '_analysis.png')
-    plt.savefig(output_file, dpi=100, bbox_inches='tight')
+    # ディレクトリ名に ".png" を含んでも壊れないようファイル名部分だけを置き換える
+    src = Path(filename)
+    output_file = str(src.with_stem(src.stem + '_analysis'))
+    # 確認用の一時画像なので圧縮は最速レベル（zlib 1）で十分
+    plt.savefig(output_file, dpi=100, bbox_inches='tight', pil_kwargs={'compress_level': 1})
     print(f"\n💾 解析画像を保存: {output_file}")
     
-    plt.show()
+    # 非対話バックエンドでは表示しない（保存のみ）
+    if plt.get_backend().lower() != "agg":
+        plt.show()
 
 
 def download_and_check(url):
@@ -142,15 +232,18 @@ def download_and_check(url):
     print(f"📥 ダウンロード中: {url}")
     
     try:
-        response = requests.get(url, timeout=10)
-        if response.status_code != 200:
-            print(f"❌ ダウンロード失敗: HTTP {response.status_code}")
-            return
-        
-        img = Image.open(BytesIO(response.content))
+        # タイルは小さいので本文を受け取ってからデコード（raw は seek できず、結局メモリに読み込まれる）
+        with _get_session().get(url, timeout=10) as response:
+            if response.status_code != 200:
+                print(f"❌ ダウンロード失敗: HTTP {response.status_code}")
+                return
+            
+            img = Image.open(io.BytesIO(response.content), formats=["PNG"])
+            img.load()
         
         # 一時保存
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # 複数URLを並列処理しても衝突しないようマイクロ秒まで付ける
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
         os.makedirs("debug_images", exist_ok=True)
         filename = f"debug_images/direct_{timestamp}.png"
         img.save(filename)
@@ -158,13 +251,14 @@ def download_and_check(url):
         
         # 解析
         if img.mode == 'RGBA':
-            alpha = np.array(img.getchannel('A'))
+            rgba = np.asarray(img)
+            alpha = rgba[..., 3]
             print(f"\n📊 画像情報:")
             print(f"  サイズ: {img.size}")
             print(f"  モード: {img.mode}")
             print(f"  非ゼロピクセル: {np.count_nonzero(alpha)} / {alpha.size}")
             
-            visualize_tile(img, alpha, filename)
+            visualize_tile(rgba, filename)
         else:
             print("⚠️ アルファチャンネルがありません")
             
@@ -172,6 +266,14 @@ def download_and_check(url):
         print(f"❌ エラー: {e}")
 
 
+def _init_batch_worker(pretty):
+    """並列処理ワーカーの初期化（ウィンドウは出さず保存のみ、--pretty を引き継ぐ）"""
+    global PRETTY
+    PRETTY = pretty
+    import matplotlib
+    matplotlib.use("Agg")
+
+
 def main():
     """メイン処理"""
     
@@ -179,9 +281,19 @@ def main():
     print("🔍 気象庁タイル画像確認ツール")
     print("=" * 60)
     
-    if len(sys.argv) > 1:
+    global PRETTY
+    args = sys.argv[1:]
+    if "--pretty" in args:
+        PRETTY = True
+        args.remove("--pretty")
+    
+    if len(args) > 1:
+        # 複数URL: ダウンロードとPNG保存をプロセス並列で処理
+        with ProcessPoolExecutor(initializer=_init_batch_worker, initargs=(PRETTY,)) as ex:
+            list(ex.map(download_and_check, args))
+    elif args:
         # URLが指定された場合
-        url = sys.argv[1]
+        url = args[0]
         download_and_check(url)
     else:
         # 保存済み画像を確認
@@ -191,18 +303,17 @@ def main():
         print("💡 使い方:")
         print("  保存済み画像確認: python check_tile.py")
         print("  URL指定:         python check_tile.py [URL]")
+        print("  複数URL(並列):   python check_tile.py [URL1] [URL2] ...")
+        print("  目盛り/カラーバー付き: --pretty を追加")
         print("\n例:")
         print('  python check_tile.py "https://www.jma.go.jp/bosai/jmatile/data/nowc/20250806213500/none/20250806213500/surf/hrpns/10/907/405.png"')
 
 
 if __name__ == "__main__":
-    # 必要なライブラリチェック
-    try:
-        import matplotlib
-        import numpy
-        import requests
-    except ImportError as e:
-        print(f"❌ 必要なライブラリがありません: {e}")
+    # 必要なライブラリチェック（import はせず存在だけ確認する）
+    missing = [m for m in ("matplotlib", "numpy", "requests") if importlib.util.find_spec(m) is None]
+    if missing:
+        print(f"❌ 必要なライブラリがありません: {', '.join(missing)}")
         print("   pip install matplotlib numpy requests pillow")
         sys.exit(1)
     
@@ -11,11 +11,20 @@ monitor.py – JMAはポイント数値APIは未提供、PNG解析でmm/h推定
   - メッシュサイズは緯度補正した m/pixel を表示
 """
 
-import json, os, sys, time, math
+import json, os, sys, time, math, bisect, copy, random, io
+import importlib.util
+from array import array
 from datetime import datetime, timedelta
-from io import BytesIO
+from functools import lru_cache
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import logging
+from logging.handlers import RotatingFileHandler
 from typing import Tuple, Optional, Dict, Any
 
+from pidfile import PID_PATH, read_pid, pid_alive
+
 import requests
 from requests.adapters import HTTPAdapter
 try:
@@ -24,16 +33,18 @@ try:
 except Exception:
     Retry = None
 
+import numpy as np
 from PIL import Image, ImageDraw
 import atexit
 import signal
 
 # ───────────────────────────────────────────
 # Windows Outlook メール送信
+# win32com の読み込みは重いので、ここでは有無だけ確認し実際の import は送信時まで遅らせる
 try:
-    import win32com.client
-    WINDOWS_EMAIL = True
-except ImportError:
+    WINDOWS_EMAIL = (importlib.util.find_spec("pythoncom") is not None
+                     and importlib.util.find_spec("win32com") is not None)
+except (ImportError, ValueError):
     WINDOWS_EMAIL = False
 
 # ログ抑制フラグ（設定から動的に更新）
@@ -44,6 +55,8 @@ SUPPRESS_WARN = False
 # identity: 1..60 → そのままmm/h, 61..65は拡張値
 STEP_TO_MM_IDENTITY = {a: a for a in range(1, 61)}
 STEP_TO_MM_IDENTITY.update({61: 80, 62: 100, 63: 150, 64: 200, 65: 300})
+# 同じ内容を step(0..255, パレットindexの範囲) で直接引ける表にしたもの。未定義は0
+_STEP_TO_MM_IDENTITY_LUT = array('H', (STEP_TO_MM_IDENTITY.get(s, 0) for s in range(256)))
 
 def convert_step_to_mmh(step: int, mapping_mode: str = "identity") -> float:
     """ステップ値(0..65)を mm/h に変換。
@@ -62,12 +75,14 @@ def convert_step_to_mmh(step: int, mapping_mode: str = "identity") -> float:
     """
     if step is None or step <= 0:
         return 0.0
-
-    mmh_identity = float(STEP_TO_MM_IDENTITY.get(step, 0.0))
+    if step >= 256:
+        return 0.0
     if mapping_mode == "identity":
-        return mmh_identity
+        return float(_STEP_TO_MM_IDENTITY_LUT[step])
+    return _STEP_TO_MM_JMA[step]
 
-    m = mmh_identity
+def _round_to_jma_bin(m: float) -> float:
+    """mm/h を気象庁の色階級の上端に丸める（80以上は情報保持）"""
     if m <= 0.0:  return 0.0
     if m <= 1.0:  return 1.0
     if m <= 5.0:  return 5.0
@@ -79,6 +94,9 @@ def convert_step_to_mmh(step: int, mapping_mode: str = "identity") -> float:
     # 80以上は情報保持
     return m
 
+# jma_bins 用の変換表（step 0..255 → mm/h）。起動時に1回だけ計算
+_STEP_TO_MM_JMA = tuple(_round_to_jma_bin(float(v)) for v in _STEP_TO_MM_IDENTITY_LUT)
+
 # ───────────────────────────────────────────
 # JMA配色（RGB厳密値）。±2の許容でマッチング
 JMA_COLOR_BINS = {
@@ -92,19 +110,42 @@ JMA_COLOR_BINS = {
     (180,0,104):   (80.0, None, None),  # 80以上帯
 }
 
+# 色→階級の照合テーブル（チャンネルごとに「±tol で一致する配色のビット集合」を持つ）
+_JMA_BIN_REPS = tuple(80.0 if rep is None else rep for (_lo,_hi,rep) in JMA_COLOR_BINS.values())
+
+@lru_cache(maxsize=4)
+def _color_masks(tol:int) -> Tuple[Tuple[int,...], Tuple[int,...], Tuple[int,...]]:
+    masks = [[0]*256 for _ in range(3)]
+    for i, color in enumerate(JMA_COLOR_BINS):
+        for ch, c in enumerate(color):
+            for v in range(max(0, c-tol), min(255, c+tol) + 1):
+                masks[ch][v] |= 1 << i
+    return tuple(tuple(m) for m in masks)
+
 def match_color_to_bin(r:int,g:int,b:int, tol:int=2) -> Optional[float]:
     """RGBをJMA配色に近傍一致させ、代表値(mm/h)を返す。無該当ならNone"""
-    for (cr,cg,cb),(lo,hi,rep) in JMA_COLOR_BINS.items():
-        if abs(r-cr)<=tol and abs(g-cg)<=tol and abs(b-cb)<=tol:
-            # 80以上帯は代表値を返さず None にして step→mm/h に委ねるか、80代表値を返す
-            return 80.0 if rep is None else rep
-    return None
+    mr, mg, mb = _color_masks(tol)
+    hit = mr[r] & mg[g] & mb[b]
+    if not hit:
+        return None
+    # 複数一致時は JMA_COLOR_BINS の先頭側を優先（80以上帯は 80 を代表値とする）
+    return _JMA_BIN_REPS[(hit & -hit).bit_length() - 1]
 
 # ───────────────────────────────────────────
+_CFG_CACHE: Dict[str, Any] = {"key": None, "data": None}
+
 def load_config():
+    """config.json を読み込む。ファイルが更新されていなければ前回の解析結果を使う。
+    呼び出し側で書き換えても共有キャッシュが汚れないよう、毎回コピーを返す。
+    """
     try:
-        with open("config.json", encoding="utf-8") as f:
-            return json.load(f)
+        st = os.stat("config.json")
+        key = (st.st_mtime_ns, st.st_size)
+        if _CFG_CACHE["key"] != key:
+            with open("config.json", encoding="utf-8") as f:
+                _CFG_CACHE["data"] = json.load(f)
+            _CFG_CACHE["key"] = key
+        return copy.deepcopy(_CFG_CACHE["data"])
     except FileNotFoundError:
         return {
             "location": {
@@ -112,14 +153,56 @@ def load_config():
                 "lat": 35.126474871810345,
                 "lon": 138.91109391000256,
             },
-            "monitoring": {"enabled": False, "interval_minutes": 3, "lead_minutes": 0},
+            "monitoring": {"enabled": False, "interval_minutes": 5, "lead_minutes": 0},
             "thresholds": {"heavy_rain": 30, "torrential_rain": 50},
             "notification": {"email_to": "", "enabled": True},
             "heartbeat": {"enabled": True, "times": ["09:00", "17:00"]},
-            "debug_images": {"retention_hours": 12, "max_files": 500, "max_total_mb": 200},
+            "debug_images": {"enabled": True, "retention_hours": 12, "max_files": 500, "max_total_mb": 200},
             "debug": False
         }
 
+LOG_PATH = os.path.join("logs", "monitor.log")
+_logger: Optional[logging.Logger] = None
+
+class _AppendPerWriteHandler(logging.FileHandler):
+    """1行ごとに開いて追記し、すぐ閉じる。
+    ワーカー以外（UI からの `run_once` など）はファイルを開いたままにしないことで、
+    ワーカー側のローテーション（リネーム）を妨げず、常に現在の monitor.log に書く。
+    """
+    def emit(self, record):
+        try:
+            super().emit(record)
+        finally:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+
+def _get_logger(rotate: bool = False) -> logging.Logger:
+    """ログ出力先（logs/monitor.log と標準出力）を初回だけ構成して返す。
+    rotate=True（常駐ワーカーのみ）ではファイルを開いたまま追記し、5MB ごとにローテーション（3世代）。
+    それ以外のプロセスは1行ごとに開閉して追記する（ローテーションはワーカーだけが行う）。
+    """
+    global _logger
+    if _logger is None:
+        os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+        logger = logging.getLogger("rain_monitor")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        if not logger.handlers:
+            fmt = logging.Formatter("[%(asctime)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+            if rotate:
+                file_handler = RotatingFileHandler(LOG_PATH, maxBytes=5_000_000, backupCount=3,
+                                                   encoding="utf-8", delay=True)
+            else:
+                file_handler = _AppendPerWriteHandler(LOG_PATH, encoding="utf-8", delay=True)
+            file_handler.setFormatter(fmt)
+            logger.addHandler(file_handler)
+            stream_handler = logging.StreamHandler(sys.stdout)
+            stream_handler.setFormatter(fmt)
+            logger.addHandler(stream_handler)
+        _logger = logger
+    return _logger
+
 def log_message(msg: str):
     # [DEBUG]で始まるメッセージは除外
     if msg.startswith("[DEBUG]"):
@@ -128,12 +211,7 @@ def log_message(msg: str):
     if msg.startswith("[WARN]") and SUPPRESS_WARN:
         return
     
-    os.makedirs("logs", exist_ok=True)
-    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    line = f"[{ts}] {msg}"
-    with open("logs/monitor.log", "a", encoding="utf-8") as f:
-        f.write(line + "\n")
-    print(line)
+    _get_logger().info(msg)
 
 
 def prune_debug_images(retention_hours: int = 12, max_files: int = 500, max_total_mb: int = 200):
@@ -146,67 +224,59 @@ def prune_debug_images(retention_hours: int = 12, max_files: int = 500, max_tota
         folder = "debug_images"
         if not os.path.isdir(folder):
             return
-        entries = []
+        entries = []  # (mtime, size, path)
         now = time.time()
-        for name in os.listdir(folder):
-            path = os.path.join(folder, name)
-            if not os.path.isfile(path):
-                continue
-            try:
-                st = os.stat(path)
-                entries.append({
-                    "path": path,
-                    "mtime": st.st_mtime,
-                    "size": st.st_size,
-                })
-            except Exception:
-                continue
+        with os.scandir(folder) as it:
+            for e in it:
+                try:
+                    if not e.is_file():
+                        continue
+                    st = e.stat()
+                    entries.append((st.st_mtime, st.st_size, e.path))
+                except Exception:
+                    continue
 
         if not entries:
             return
+        # 3つの条件はいずれも「古い順に削除」なので、1回ソートして先頭から何件消すかを決める
+        entries.sort()
 
-        # 1) 保持期間を超えた古いファイルを削除
+        # 1) 保持期間を超えた古いファイル
         cutoff = now - (retention_hours * 3600)
-        for e in sorted(entries, key=lambda x: x["mtime"])[:]:
-            if e["mtime"] < cutoff:
-                try:
-                    os.remove(e["path"])
-                except Exception:
-                    pass
-                entries.remove(e)
+        n_remove = bisect.bisect_left(entries, (cutoff,))
 
-        # 2) 総ファイル数が多い場合、古い順に削除
-        if len(entries) > max_files:
-            overflow = len(entries) - max_files
-            for e in sorted(entries, key=lambda x: x["mtime"])[:overflow]:
-                try:
-                    os.remove(e["path"])
-                except Exception:
-                    pass
-                entries.remove(e)
+        # 2) 総ファイル数が多い場合、古い順に
+        n_remove = max(n_remove, len(entries) - max_files)
 
-        # 3) 合計サイズが上限を超える場合、古い順に削除
-        total_bytes = sum(e["size"] for e in entries)
+        # 3) 合計サイズが上限を超える場合、古い順に
         limit_bytes = max_total_mb * 1024 * 1024
-        if total_bytes > limit_bytes:
-            for e in sorted(entries, key=lambda x: x["mtime"]):
-                try:
-                    os.remove(e["path"])
-                except Exception:
-                    pass
-                total_bytes -= e["size"]
-                if total_bytes <= limit_bytes:
-                    break
+        total_bytes = sum(e[1] for e in entries[n_remove:])
+        while total_bytes > limit_bytes and n_remove < len(entries):
+            total_bytes -= entries[n_remove][1]
+            n_remove += 1
+
+        for _mtime, _size, path in entries[:n_remove]:
+            try:
+                os.remove(path)
+            except Exception:
+                pass
     except Exception:
         # ログは肥大させないためエラーは黙殺
         pass
 
 def send_outlook_email(to_addr, subject, body):
     try:
-        outlook = win32com.client.Dispatch("outlook.application")
-        mail = outlook.CreateItem(0)
-        mail.To, mail.Subject, mail.Body = to_addr, subject, body
-        mail.Send()
+        import pythoncom
+        import win32com.client
+        # 地点処理のワーカースレッドからも呼ばれるため、スレッドごとに COM を初期化する
+        pythoncom.CoInitialize()
+        try:
+            outlook = win32com.client.Dispatch("outlook.application")
+            mail = outlook.CreateItem(0)
+            mail.To, mail.Subject, mail.Body = to_addr, subject, body
+            mail.Send()
+        finally:
+            pythoncom.CoUninitialize()
         log_message(f"メール送信成功: {to_addr}")
         return True
     except Exception as e:
@@ -230,60 +300,121 @@ def parse_email_list(raw: Optional[str]) -> list:
     except Exception:
         return [raw]
 
+# ───────────────────────────────────────────
+def _parse_jma_time(s: str) -> datetime:
+    """JMA の時刻文字列 YYYYmmddHHMMSS（UTC）を datetime に変換。strptime より大幅に速い"""
+    return datetime(int(s[0:4]), int(s[4:6]), int(s[6:8]), int(s[8:10]), int(s[10:12]), int(s[12:14]))
+
+# ───────────────────────────────────────────
+# 地理座標計算（lat/lon/zoom の純関数なのでメモ化）
+@lru_cache(maxsize=4096)
+def _latlon_to_tilepix(lat: float, lon: float, zoom: int) -> Tuple[int,int,int,int]:
+    """緯度経度 → (タイルx, タイルy, タイル内px, タイル内py)"""
+    n = 1 << zoom
+    x_f = (lon + 180.0) / 360.0 * n
+    y_f = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n
+    x_frac, x_int = math.modf(x_f)
+    y_frac, y_int = math.modf(y_f)
+    return int(x_int), int(y_int), int(x_frac * 256), int(y_frac * 256)
+
+@lru_cache(maxsize=4096)
+def _mpp(lat: float, zoom: int) -> float:
+    # meters per pixel at latitude
+    return 156543.03392 * math.cos(math.radians(lat)) / (2**zoom)
+
+# ───────────────────────────────────────────
+_SESSION: Optional[requests.Session] = None
+
+def _get_session() -> requests.Session:
+    """プロセス共通の HTTP セッションを返す（初回のみ作成）"""
+    global _SESSION
+    if _SESSION is None:
+        session = requests.Session()
+        session.headers.update({"User-Agent": "rain-monitor/1.0 (+github) python-requests"})
+        if Retry is not None:
+            retries = Retry(total=3, backoff_factor=0.5, status_forcelist=(429,500,502,503,504))
+            # 地点スレッド(最大8)＋先読みスレッド(8)が同時に使っても接続を捨てない大きさにする
+            adapter = HTTPAdapter(max_retries=retries, pool_connections=10, pool_maxsize=16)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        _SESSION = session
+    return _SESSION
+
+_PREFETCH_POOL: Optional[ThreadPoolExecutor] = None
+_PREFETCH_POOL_LOCK = threading.Lock()
+
+def _get_prefetch_pool() -> ThreadPoolExecutor:
+    """タイル先読み用のプロセス共通スレッドプール（初回のみ作成）。
+    UI から run_once のたびに API を作っても、アイドルなプールが溜まらないようにする。
+    """
+    global _PREFETCH_POOL
+    with _PREFETCH_POOL_LOCK:
+        if _PREFETCH_POOL is None:
+            _PREFETCH_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tile-prefetch")
+        return _PREFETCH_POOL
+
 # ───────────────────────────────────────────
 class JMANowcastAPI:
     """PNG タイルから降水強度を取得（αと色で判定／デバッグ機能付き）"""
 
     BASE = "https://www.jma.go.jp/bosai/jmatile/data/nowc"
-
-    def __init__(self, zoom: int = 10, debug: bool = False):
+    TILE_CACHE_MAX = 64  # タイルキャッシュの最大保持数（既定値。一括先読み時は件数に合わせて広げる）
+    # 窓で集約する判定方式: method → (窓サイズ, 集約方法)
+    WINDOW_METHODS = {
+        "average_2x2": (2, "mean"),
+        "max_2x2": (2, "max"),
+        "max_3x3": (3, "max"),
+        "max_4x4": (4, "max"),
+        "max_8x8": (8, "max"),
+    }
+
+    def __init__(self, zoom: int = 10, debug: bool = False, save_debug_images: bool = True,
+                 tile_cache_max: Optional[int] = None):
         self.zoom = zoom
         self.debug = debug
+        self.save_debug_images = save_debug_images  # debug 時に判定可視化PNGを保存するか
 
-        # HTTPセッション
-        self.session = requests.Session()
-        self.session.headers.update({"User-Agent": "rain-monitor/1.0 (+github) python-requests"})
-        if Retry is not None:
-            retries = Retry(total=3, backoff_factor=0.5, status_forcelist=(429,500,502,503,504))
-            adapter = HTTPAdapter(max_retries=retries, pool_connections=10, pool_maxsize=10)
-            self.session.mount("https://", adapter)
-            self.session.mount("http://", adapter)
+        # HTTPセッション（プロセス内で共有し、TCP/TLS接続を使い回す）
+        self.session = _get_session()
 
         # targetTimesキャッシュ
-        self._times_cache: Dict[str, Dict[str, Any]] = {}  # {"N1": {"ts":dt, "data":[...]}, "N2":{...}}
+        self._times_cache: Dict[str, Dict[str, Any]] = {}  # {"N1": {"ts":dt, "data":[...], "etag", "last_modified"}, "N2":{...}}
+        # デコード済みタイルのLRUキャッシュ {(bt, vt, zoom, x, y): (img, url)}
+        self._tile_cache: "OrderedDict[tuple, Tuple[Image.Image, str]]" = OrderedDict()
+        self._tile_lock = threading.Lock()
+        self.tile_cache_max = int(tile_cache_max or self.TILE_CACHE_MAX)  # 通常時の最大保持数
+        self._tile_cache_limit = self.tile_cache_max  # 一括先読みの件数に合わせて広げる（fetch_many）
+        self._last_good_pattern_idx = 0  # 直近で取得に成功したタイルURLパターン
 
         if self.debug:
             log_message(f"[DEBUG] init zoom={self.zoom}")
 
     # ── 地理座標計算 ──
-    def _deg2tile(self, lat: float, lon: float) -> Tuple[int,int]:
-        z = self.zoom
-        lat_rad = math.radians(lat)
-        n = 2.0**z
-        xtile = int((lon + 180.0) / 360.0 * n)
-        ytile = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
-        return xtile, ytile
-
-    def _pixel_in_tile(self, lat: float, lon: float) -> Tuple[int,int]:
-        z = self.zoom
-        lat_rad = math.radians(lat)
-        n = 2.0**z
-        x_f = (lon + 180.0) / 360.0 * n
-        y_f = (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n
-        return int((x_f - int(x_f)) * 256), int((y_f - int(y_f)) * 256)
+    def _tilepix(self, lat: float, lon: float) -> Tuple[int,int,int,int]:
+        return _latlon_to_tilepix(lat, lon, self.zoom)
 
     def _mpp(self, lat: float) -> float:
-        # meters per pixel at latitude
-        return 156543.03392 * math.cos(math.radians(lat)) / (2**self.zoom)
+        return _mpp(lat, self.zoom)
 
     # ── 画像ユーティリティ ──
     @staticmethod
-    def _alpha_at(img: Image.Image, x:int, y:int) -> int:
-        return (img if img.mode=='RGBA' else img.convert('RGBA')).getchannel('A').getpixel((x,y))
+    def _as_np(img: Image.Image) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """(RGBA配列 H×W×4, Pモードならパレットindex配列 H×W / それ以外は None) を返す。
+        変換は1タイル1回だけ行い、結果は画像オブジェクトに保持して再利用する。
+        """
+        rgba = getattr(img, "_rgba_np", None)
+        if rgba is None:
+            rgba = np.asarray(img if img.mode == 'RGBA' else img.convert('RGBA'))
+            img._palette_idx = np.asarray(img) if img.mode == 'P' else None
+            img._has_rain = bool(rgba[..., 3].any())
+            img._rgba_np = rgba  # 他スレッドから見て「変換済み」になるのは全属性が揃ってから
+        return rgba, img._palette_idx
 
     @staticmethod
-    def _rgb_at(img: Image.Image, x:int, y:int) -> Tuple[int,int,int]:
-        return (img if img.mode=='RGB' else img.convert('RGB')).getpixel((x,y))
+    def _has_rain(img: Image.Image) -> bool:
+        """タイル内に α>0 の画素が1つでもあるか（なければタイル全体が降水なし）"""
+        JMANowcastAPI._as_np(img)
+        return img._has_rain
 
     # ── targetTimes 取得（60秒キャッシュ） ──
     def _get_target_times(self, kind: str):
@@ -295,10 +426,26 @@ class JMANowcastAPI:
             return entry["data"]
         if self.debug:
             log_message(f"[DEBUG] fetch targetTimes {kind}: {url}")
-        r = self.session.get(url, timeout=10)
+        # 期限切れでも前回の ETag / Last-Modified で再検証し、未更新(304)なら本文を取り直さない
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        r = self.session.get(url, timeout=10, headers=headers)
+        if r.status_code == 304 and entry:
+            entry["ts"] = now
+            return entry["data"]
         r.raise_for_status()
         data = r.json()
-        self._times_cache[kind] = {"ts": now, "data": data}
+        if data and isinstance(data[0], dict):
+            # 取得時に1回だけ解析: (basetime, validtime, validtime(JST))
+            data = [(it["basetime"], it["validtime"], _parse_jma_time(it["validtime"]) + timedelta(hours=9))
+                    for it in data]
+        self._times_cache[kind] = {"ts": now, "data": data,
+                                   "etag": r.headers.get("ETag"),
+                                   "last_modified": r.headers.get("Last-Modified")}
         return data
 
     def _latest_times(self, target_offset_minutes: int = 0) -> Tuple[str, str]:
@@ -312,22 +459,18 @@ class JMANowcastAPI:
 
             target_jst = datetime.now() + timedelta(minutes=clamped)
 
-            if isinstance(data[0], dict):
-                # {"basetime","validtime"} の配列から target に最も近い要素を選ぶ
-                def jst_dt(item):
-                    return datetime.strptime(item["validtime"], "%Y%m%d%H%M%S") + timedelta(hours=9)
-                best = min(data, key=lambda it: abs((jst_dt(it) - target_jst).total_seconds()))
-                bt_str = best["basetime"]
-                vt_str = best["validtime"]
+            if isinstance(data[0], tuple):
+                # {"basetime","validtime"} の配列（解析済み）から target に最も近い要素を選ぶ
+                bt_str, vt_str, _ = min(data, key=lambda it: abs((it[2] - target_jst).total_seconds()))
             else:
                 # ["basetime", ...] 形式
                 bt_str = data[0]  # 最新想定
-                bt = datetime.strptime(bt_str, "%Y%m%d%H%M%S")
+                bt = _parse_jma_time(bt_str)
                 vt = bt + timedelta(minutes=clamped)
                 vt_str = vt.strftime("%Y%m%d%H%M%S")
 
             if self.debug:
-                vt_dbg = datetime.strptime(vt_str, "%Y%m%d%H%M%S") + timedelta(hours=9)
+                vt_dbg = _parse_jma_time(vt_str) + timedelta(hours=9)
                 log_message(f"[DEBUG] basetime={bt_str}, validtime={vt_str} (JST {vt_dbg:%Y-%m-%d %H:%M:%S}) target={target_jst:%H:%M}")
             return bt_str, vt_str
 
@@ -336,36 +479,80 @@ class JMANowcastAPI:
             raise
 
     # ── PNGタイル取得 ──
-    def _fetch_tile_png(self, basetime, validtime, x, y) -> Tuple[Image.Image, str]:
+    def _fetch_tile_png(self, basetime, validtime, x, y, zoom: Optional[int] = None) -> Tuple[Image.Image, str]:
+        # 同じ basetime/validtime のタイルは内容が変わらないので、取得済みならそのまま返す
+        zoom = self.zoom if zoom is None else zoom
+        key = (basetime, validtime, zoom, x, y)
+        with self._tile_lock:
+            cached = self._tile_cache.get(key)
+            if cached is not None:
+                self._tile_cache.move_to_end(key)
+                return cached
+        img, url = self._download_tile_png(basetime, validtime, x, y, zoom)
+        with self._tile_lock:
+            self._tile_cache[key] = (img, url)
+            while len(self._tile_cache) > self._tile_cache_limit:
+                self._tile_cache.popitem(last=False)
+        return img, url
+
+    def fetch_many(self, keys) -> int:
+        """(basetime, validtime, x, y) の一覧をまとめて並列取得し、タイルキャッシュに載せる。
+        先読みした分が本取得の前に追い出されないよう、キャッシュ上限を一括分の件数まで広げる。
+        取得できた件数を返す（失敗したキーは本取得時に改めてエラーとして扱う）。
+        """
+        keys = list(dict.fromkeys(keys))  # 重複除去（順序維持）
+        with self._tile_lock:
+            self._tile_cache_limit = max(self.tile_cache_max, len(keys))
+        # I/O待ちが主なのでスレッドで並列化（プールはプロセス内で共有）
+        pool = _get_prefetch_pool()
+        futures = {k: pool.submit(self._fetch_tile_png, *k) for k in keys}
+        loaded = 0
+        for k, fut in futures.items():
+            try:
+                fut.result()
+                loaded += 1
+            except Exception as e:
+                if self.debug:
+                    log_message(f"[DEBUG] 先読み失敗: {k} {e}")
+        return loaded
+
+    def _download_tile_png(self, basetime, validtime, x, y, zoom: int) -> Tuple[Image.Image, str]:
         url_patterns = [
-            f"{self.BASE}/{basetime}/none/{validtime}/surf/hrpns/{self.zoom}/{x}/{y}.png",
-            f"{self.BASE}/{basetime}/{validtime}/surf/hrpns/{self.zoom}/{x}/{y}.png",
-            f"{self.BASE}/{basetime}/none/{validtime}/surf/rasrf/{self.zoom}/{x}/{y}.png",
+            f"{self.BASE}/{basetime}/none/{validtime}/surf/hrpns/{zoom}/{x}/{y}.png",
+            f"{self.BASE}/{basetime}/{validtime}/surf/hrpns/{zoom}/{x}/{y}.png",
+            f"{self.BASE}/{basetime}/none/{validtime}/surf/rasrf/{zoom}/{x}/{y}.png",
         ]
+        # 前回成功したパターンから試す（通常は1回目で当たる）
+        first = self._last_good_pattern_idx
+        order = [first] + [i for i in range(len(url_patterns)) if i != first]
         last_err = None
-        for url in url_patterns:
+        for i in order:
+            url = url_patterns[i]
             try:
                 if self.debug:
                     log_message(f"[DEBUG] 試行URL: {url}")
-                r = self.session.get(url, timeout=10)
-                if r.status_code == 200:
-                    img = Image.open(BytesIO(r.content))
-                    if self.debug:
-                        img_for_stats = img.convert('RGBA') if img.mode != 'RGBA' else img
-                        alpha = img_for_stats.getchannel('A')
-                        alpha_data = list(alpha.getdata())
-                        non_zero = [v for v in alpha_data if v > 0]
-                        if non_zero:
-                            log_message(f"[DEBUG] 画像: mode={img.mode} size={img.size} α(min,max,count)={min(non_zero)},{max(non_zero)},{len(non_zero)}")
-                        else:
-                            log_message(f"[DEBUG] 画像: αすべて0（降水なし）")
-                    return img, url
-                elif r.status_code == 404:
-                    if self.debug:
-                        log_message(f"[DEBUG] 404 Not Found: {url}")
-                    continue
-                else:
-                    last_err = f"HTTP {r.status_code}"
+                # タイルは小さい（数KB〜数十KB）ので本文を受け取ってからデコードする
+                # （r.raw は seek できず、Image.open は結局全体をメモリに読み込むため stream=True の利点はない）
+                with self.session.get(url, timeout=10) as r:
+                    if r.status_code == 200:
+                        img = Image.open(io.BytesIO(r.content), formats=["PNG"])
+                        img.load()
+                        rgba, _ = self._as_np(img)  # RGBA変換はここで1回だけ
+                        if self.debug:
+                            a = rgba[..., 3]
+                            non_zero = a[a > 0]
+                            if non_zero.size:
+                                log_message(f"[DEBUG] 画像: mode={img.mode} size={img.size} α(min,max,count)={non_zero.min()},{non_zero.max()},{non_zero.size}")
+                            else:
+                                log_message(f"[DEBUG] 画像: αすべて0（降水なし）")
+                        self._last_good_pattern_idx = i
+                        return img, url
+                    elif r.status_code == 404:
+                        if self.debug:
+                            log_message(f"[DEBUG] 404 Not Found: {url}")
+                        continue
+                    else:
+                        last_err = f"HTTP {r.status_code}"
             except Exception as e:
                 last_err = str(e)
                 if self.debug:
@@ -376,168 +563,239 @@ class JMANowcastAPI:
     # ── 共通コア ──
     def _calc_step_at(self, img:Image.Image, x:int, y:int) -> int:
         """中心ピクセルの step を返す。α=0→0。Pモードはパレットindex、非Pは有無で1/0。"""
-        a = self._alpha_at(img, x, y)
-        if a == 0:
+        rgba, idx = self._as_np(img)
+        if rgba[y, x, 3] == 0:
             return 0
-        if img.mode == 'P':
-            return int(img.getpixel((x,y)))
+        if idx is not None:
+            return int(idx[y, x])
         # 非Pモードは階級情報が失われている前提 → 1 (有降水)
         return 1
 
-    def _calc_step_in_window(self, img:Image.Image, px:int, py:int, size:int) -> int:
-        """中心(px,py)にできるだけ揃えた size×size の最大stepを返す（α=0は0）。
-        偶数サイズの場合は中心が画素間になるため、(px,py) の±(size//2-1, size//2)で
-        可能な限り対称に近い窓を取る。端でははみ出さないように調整。
+    def _window_step(self, img:Image.Image, px:int, py:int, size:int, reduce:str = "max") -> int:
+        """(px,py) まわりの size×size 窓の step を集約して返す（α=0は0）。
+        - reduce="mean": (px,py) を左上とする窓の平均を四捨五入（画像端は端の画素を繰り返す）
+        - reduce="max" 奇数サイズ: (px,py) を中心とする窓（画像外は端の画素で代用）
+        - reduce="max" 偶数サイズ: 中心が画素間になるため、(px,py) の±(size//2-1, size//2)で
+          可能な限り対称に近い窓を取る。端でははみ出さないように窓ごとずらす。
         """
-        w, h = img.width, img.height
+        rgba, idx = self._as_np(img)
+        h, w = rgba.shape[:2]
         half = size // 2
-        start_x = px - (half - 1)
-        start_y = py - (half - 1)
-        # はみ出し補正
-        start_x = max(0, min(start_x, w - size))
-        start_y = max(0, min(start_y, h - size))
-        steps = []
-        for dx in range(size):
-            for dy in range(size):
-                x = start_x + dx
-                y = start_y + dy
-                steps.append(self._calc_step_at(img, x, y))
-        return max(steps) if steps else 0
+        if reduce == "mean" or size % 2:
+            x0, y0 = (px, py) if reduce == "mean" else (px - half, py - half)
+            ys = np.clip(np.arange(y0, y0 + size), 0, h - 1)[:, None]
+            xs = np.clip(np.arange(x0, x0 + size), 0, w - 1)
+        else:
+            x0 = max(0, min(px - (half - 1), w - size))
+            y0 = max(0, min(py - (half - 1), h - size))
+            ys = slice(y0, y0 + size)
+            xs = slice(x0, x0 + size)
+        a = rgba[ys, xs, 3]
+        # 非Pモードは有無のみ（1/0）
+        steps = (a != 0) if idx is None else np.where(a == 0, 0, idx[ys, xs])
+        if reduce == "mean":
+            return round(float(steps.mean()))
+        return int(steps.max())
 
     def _calc_color_mmh_at(self, img:Image.Image, x:int, y:int) -> Optional[float]:
         """中心ピクセルのRGBからJMA階級代表値(mm/h)を返す。α=0は0.0"""
-        a = self._alpha_at(img, x, y)
+        rgba, _ = self._as_np(img)
+        r, g, b, a = rgba[y, x]
         if a == 0:
             return 0.0
-        r,g,b = self._rgb_at(img, x, y)
-        return match_color_to_bin(r,g,b, tol=2)
+        return match_color_to_bin(int(r), int(g), int(b), tol=2)
 
     # ── 外部API ──
     def rainfall_mm_at(self, lat: float, lon: float, basetime: str, validtime: str,
-                       method: str = "single") -> Tuple[float, datetime, str]:
-        """指定 basetime/validtime で降水量取得"""
-        # タイル座標とピクセル座標
-        xt, yt = self._deg2tile(lat, lon)
-        px, py = self._pixel_in_tile(lat, lon)
-        mpp = self._mpp(lat)
-        mesh_size = f"約{round(mpp)}m/pixel"
-            
+                       method: str = "single", xt: Optional[int] = None, yt: Optional[int] = None,
+                       px: Optional[int] = None, py: Optional[int] = None,
+                       loc_name: Optional[str] = None) -> Tuple[float, datetime, str]:
+        """指定 basetime/validtime で降水量取得。
+        xt/yt/px/py（現在ズームでのタイル座標・タイル内ピクセル）を渡すと座標計算を省略する。
+        loc_name を渡すとログ行の先頭に地点名を付ける（地点は並列処理されるため）。
+        """
+        tag = f"[{loc_name}] " if loc_name else ""
+        # タイル座標とピクセル座標（high_zoom は1段高いズームのタイルだけを使う）
+        if method == "high_zoom":
+            zoom = self.zoom + 1
+            xt, yt, px, py = _latlon_to_tilepix(lat, lon, zoom)
+        else:
+            zoom = self.zoom
+            if None in (xt, yt, px, py):
+                xt, yt, px, py = self._tilepix(lat, lon)
+
         if self.debug:
-            log_message(f"座標: lat={lat:.6f}, lon={lon:.6f} zoom={self.zoom} x={xt} y={yt} px={px} py={py} {mesh_size}")
+            mesh_size = f"約{round(_mpp(lat, zoom))}m/pixel"
+            log_message(f"{tag}座標: lat={lat:.6f}, lon={lon:.6f} zoom={zoom} x={xt} y={yt} px={px} py={py} {mesh_size}")
+
+        img, png_url = self._fetch_tile_png(basetime, validtime, xt, yt, zoom=zoom)
+        vt = _parse_jma_time(validtime) + timedelta(hours=9)
+
+        # タイル全体が降水なしなら判定・可視化を省略（取得時の「αすべて0」ログで確認可能）
+        if not self._has_rain(img):
+            return 0.0, vt, png_url
 
-        img, png_url = self._fetch_tile_png(basetime, validtime, xt, yt)
-            
         # step算出
-        original_zoom = self.zoom
-        try:
-            if method == "high_zoom":
-                self.zoom += 1
-                xt, yt = self._deg2tile(lat, lon)
-                px, py = self._pixel_in_tile(lat, lon)
-                img, png_url = self._fetch_tile_png(basetime, validtime, xt, yt)
-                step = self._calc_step_at(img, px, py)
-            elif method == "average_2x2":
-                # 2x2平均→四捨五入
-                steps = []
-                for dx in (0,1):
-                    for dy in (0,1):
-                        steps.append(self._calc_step_at(img, min(px+dx, img.width-1), min(py+dy, img.height-1)))
-                step = round(sum(steps)/len(steps)) if steps else 0
-            elif method == "max_2x2":
-                step = self._calc_step_in_window(img, px, py, 2)
-            elif method == "max_3x3":
-                # 中心-1..+1 の範囲
-                steps = []
-                for dx in (-1,0,1):
-                    for dy in (-1,0,1):
-                        x = min(max(px+dx,0), img.width-1)
-                        y = min(max(py+dy,0), img.height-1)
-                        steps.append(self._calc_step_at(img, x, y))
-                step = max(steps) if steps else 0
-            elif method == "max_4x4":
-                step = self._calc_step_in_window(img, px, py, 4)
-            elif method == "max_8x8":
-                step = self._calc_step_in_window(img, px, py, 8)
-            else:
-                step = self._calc_step_at(img, px, py)
-        finally:
-            # ズームは必ず復帰
-            self.zoom = original_zoom
+        if method in self.WINDOW_METHODS:
+            size, reduce = self.WINDOW_METHODS[method]
+            step = self._window_step(img, px, py, size, reduce)
+        else:
+            step = self._calc_step_at(img, px, py)
 
         # 変換（色→階級優先、フォールバックでstep→mm/h）
         mmh_color = self._calc_color_mmh_at(img, px, py)
         mmh_step  = convert_step_to_mmh(step, mapping_mode="jma_bins")
         mmh = mmh_color if (mmh_color is not None) else mmh_step
 
-        vt = datetime.strptime(validtime, "%Y%m%d%H%M%S") + timedelta(hours=9)
-
         if self.debug:
-            log_message(f"[DEBUG] step={step} → stepConv={mmh_step:.1f} mm/h, colorConv={mmh_color if mmh_color is not None else 'None'} → use={mmh:.1f}")
+            log_message(f"[DEBUG] {tag}step={step} → stepConv={mmh_step:.1f} mm/h, colorConv={mmh_color if mmh_color is not None else 'None'} → use={mmh:.1f}")
             # デバッグ可視化
-            try:
-                overlay_img = img.convert('RGBA')
-                draw = ImageDraw.Draw(overlay_img)
-                line_thickness = 4; cross_half = 6
-                def cross(cx,cy,c=(0,0,0,255)):
-                    draw.line((cx-cross_half,cy,cx+cross_half,cy), fill=c, width=line_thickness)
-                    draw.line((cx,cy-cross_half,cx,cy+cross_half), fill=c, width=line_thickness)
-                cross(px,py)
-                info = f"{method} px={px},py={py} step={step} ({mmh:.1f}mm/h)"
-                draw.rectangle((0,0,min(overlay_img.width, 360), 16), fill=(0,0,0,160))
-                draw.text((4,2), info, fill=(255,255,255,255))
-
-                # 窓枠の可視化（中心に揃える）
-                w,h = overlay_img.width, overlay_img.height
-                def rect_centered(px:int, py:int, size:int, color):
-                    half = size // 2
-                    sx = max(px - (half - 1), 0)
-                    sy = max(py - (half - 1), 0)
-                    ex = min(sx + size - 1, w-1)
-                    ey = min(sy + size - 1, h-1)
-                    draw.rectangle((sx, sy, ex, ey), outline=color, width=line_thickness)
-
-                if method == 'average_2x2' or method == 'max_2x2':
-                    rect_centered(px, py, 2, (255, 0, 255, 255))  # マゼンタ
-                elif method == 'max_3x3':
-                    rect_centered(px, py, 3, (0, 255, 255, 255))  # シアン
-                elif method == 'max_4x4':
-                    rect_centered(px, py, 4, (0, 255, 0, 255))    # 緑
-                elif method == 'max_8x8':
-                    rect_centered(px, py, 8, (0, 0, 255, 255))    # 青
-                os.makedirs('debug_images', exist_ok=True)
-                ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-                debug_overlay_path = f"debug_images/tile_{ts}_{validtime}_{method}_z{self.zoom}_x{xt}_y{yt}_px{px}_py{py}.png"
-                overlay_img.save(debug_overlay_path)
-                log_message(f"[DEBUG] 判定可視化を保存: {debug_overlay_path}")
-            except Exception as _e:
-                log_message(f"[DEBUG] 可視化保存失敗: {_e}")
+            if self.save_debug_images:
+                try:
+                    # 図形は配列へのスライス代入で描き、文字だけ ImageDraw を使う
+                    rgba, _ = self._as_np(img)
+                    overlay = rgba.copy()
+                    h, w = overlay.shape[:2]
+                    line_thickness = 4; cross_half = 6
+                    def fill(x0:int, y0:int, x1:int, y1:int, color):
+                        # (x0,y0)-(x1,y1) を両端含みで塗る（画像外は切り詰め）
+                        overlay[max(y0,0):max(y1+1,0), max(x0,0):max(x1+1,0)] = color
+                    def cross(cx,cy,c=(0,0,0,255)):
+                        fill(cx-cross_half, cy-1, cx+cross_half, cy+2, c)
+                        fill(cx-1, cy-cross_half, cx+2, cy+cross_half, c)
+                    cross(px,py)
+                    info = f"{method} px={px},py={py} step={step} ({mmh:.1f}mm/h)"
+                    fill(0, 0, min(w, 360), 16, (0,0,0,160))
+
+                    # 窓枠の可視化（中心に揃える）。枠線は内側に line_thickness 分
+                    def rect_centered(px:int, py:int, size:int, color):
+                        half = size // 2
+                        sx = max(px - (half - 1), 0)
+                        sy = max(py - (half - 1), 0)
+                        ex = min(sx + size - 1, w-1)
+                        ey = min(sy + size - 1, h-1)
+                        t = line_thickness - 1
+                        fill(sx, sy, ex, min(sy+t, ey), color)
+                        fill(sx, max(ey-t, sy), ex, ey, color)
+                        fill(sx, sy, min(sx+t, ex), ey, color)
+                        fill(max(ex-t, sx), sy, ex, ey, color)
+
+                    if method == 'average_2x2' or method == 'max_2x2':
+                        rect_centered(px, py, 2, (255, 0, 255, 255))  # マゼンタ
+                    elif method == 'max_3x3':
+                        rect_centered(px, py, 3, (0, 255, 255, 255))  # シアン
+                    elif method == 'max_4x4':
+                        rect_centered(px, py, 4, (0, 255, 0, 255))    # 緑
+                    elif method == 'max_8x8':
+                        rect_centered(px, py, 8, (0, 0, 255, 255))    # 青
+                    overlay_img = Image.fromarray(overlay, 'RGBA')
+                    ImageDraw.Draw(overlay_img).text((4,2), info, fill=(255,255,255,255))
+                    os.makedirs('debug_images', exist_ok=True)
+                    ts = datetime.now().strftime('%Y%m%d_%H%M%S')
+                    debug_overlay_path = f"debug_images/tile_{ts}_{validtime}_{method}_z{zoom}_x{xt}_y{yt}_px{px}_py{py}.png"
+                    overlay_img.save(debug_overlay_path, optimize=False, compress_level=1)
+                    log_message(f"[DEBUG] 判定可視化を保存: {debug_overlay_path}")
+                except Exception as _e:
+                    log_message(f"[DEBUG] 可視化保存失敗: {_e}")
 
             web_url = f"https://www.jma.go.jp/bosai/nowc/#zoom:{self.zoom}/lat:{lat}/lon:{lon}/colordepth:normal/elements:hrpns"
-            log_message(f"確認用URL: {web_url}")
+            log_message(f"{tag}確認用URL: {web_url}")
             
         # 乖離チェック
         if (mmh_color is not None) and abs(mmh_color - mmh_step) >= 10.0:
-            log_message(f"[WARN] 色推定とステップ推定に乖離: color={mmh_color:.1f} stepConv={mmh_step:.1f} mm/h @ ({px},{py})")
+            log_message(f"[WARN] {tag}色推定とステップ推定に乖離: color={mmh_color:.1f} stepConv={mmh_step:.1f} mm/h @ ({px},{py})")
 
         return mmh, vt, png_url
 
+    def rainfalls_multi(self, lat: float, lon: float, times: Dict[int, Tuple[str,str]],
+                        method: str = "single", **geo) -> list:
+        """固定済みの {lead_minutes: (basetime, validtime)} をまとめて判定し、
+        [(lead_minutes, mm/h, validtime(JST))] を返す。同じ時刻に解決された lead は1回だけ判定する。
+        """
+        done: Dict[Tuple[str,str], Tuple[float, datetime, str]] = {}
+        results = []
+        for lm, bt_vt in times.items():
+            if bt_vt not in done:
+                done[bt_vt] = self.rainfall_mm_at(lat, lon, *bt_vt, method=method, **geo)
+            r, t_jst, _ = done[bt_vt]
+            results.append((lm, r, t_jst))
+        return results
+
     def rainfall_mm(self, lat: float, lon: float, lead_minutes: int = 0, method: str = "single"):
         """lead_minutes を指定して降水量取得（内部で targetTimes を決定）"""
         bt, vt = self._latest_times(target_offset_minutes=lead_minutes)
         return self.rainfall_mm_at(lat, lon, bt, vt, method=method)
 
 # ───────────────────────────────────────────
+# 死活通知の送信枠（予定時刻の YYYYmmddHHMM）。ワーカーと UI（run_once）で重ねて送らないよう、
+# 送信前に logs/heartbeat_sent_<stamp> を O_CREAT|O_EXCL で作って枠を原子的に確保する
+HEARTBEAT_CLAIM_PREFIX = "heartbeat_sent_"
+HEARTBEAT_MAX_LOOKBACK = timedelta(minutes=60)  # 前回判定からこれ以上さかのぼって送らない
+_heartbeat_last_check: Optional[datetime] = None
+
+def _claim_heartbeat_slot(stamp: str) -> bool:
+    """送信枠を確保できれば True。既に他プロセス（または以前の実行）が確保済みなら False"""
+    os.makedirs("logs", exist_ok=True)
+    try:
+        os.close(os.open(os.path.join("logs", HEARTBEAT_CLAIM_PREFIX + stamp),
+                         os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        return False
+
+def _release_heartbeat_slot(stamp: str):
+    """送信に失敗した枠を手放し、次回のチェックで再送できるようにする"""
+    try:
+        os.remove(os.path.join("logs", HEARTBEAT_CLAIM_PREFIX + stamp))
+    except OSError:
+        pass
+
+def _prune_heartbeat_claims(keep_from: str):
+    """keep_from（YYYYmmddHHMM）より古い送信枠のファイルを削除"""
+    try:
+        with os.scandir("logs") as it:
+            for e in it:
+                if e.name.startswith(HEARTBEAT_CLAIM_PREFIX) and e.name[len(HEARTBEAT_CLAIM_PREFIX):] < keep_from:
+                    try:
+                        os.remove(e.path)
+                    except OSError:
+                        pass
+    except OSError:
+        pass
+
+def _due_heartbeat_slots(times, since: datetime, now: datetime) -> list:
+    """設定時刻（HH:MM）のうち (since, now] に入る予定時刻を返す（日付またぎも考慮）"""
+    due = []
+    for t in times:
+        try:
+            hh, mm = (int(v) for v in str(t).split(":"))
+            slot = now.replace(hour=hh, minute=mm, second=0, microsecond=0)
+        except ValueError:
+            continue
+        for cand in (slot, slot - timedelta(days=1)):
+            if since < cand <= now:
+                due.append(cand)
+    return sorted(due)
+
 def maybe_send_heartbeat(cfg):
-    """指定した時刻（HH:MM, JST）に日次の死活通知を送信。1分粒度で判定。"""
+    """指定した時刻（HH:MM, JST）に日次の死活通知を送信。
+    チェックは5分境界ごとなので、前回判定から今回までの間に入った設定時刻を送信対象にする。
+    """
+    global _heartbeat_last_check
     try:
+        now = datetime.now()
+        # 初回は現在の分だけを見る（起動直後に過去分をまとめて送らない）
+        since = _heartbeat_last_check or (now.replace(second=0, microsecond=0) - timedelta(seconds=1))
+        since = max(since, now - HEARTBEAT_MAX_LOOKBACK)
+        _heartbeat_last_check = now
+
         hb = cfg.get("heartbeat", {})
         if not hb or not hb.get("enabled", False):
             return
         times = hb.get("times", []) or []
 
-        now = datetime.now()
-        current = now.strftime("%H:%M")
-        if current not in times:
+        stamps = [slot.strftime("%Y%m%d%H%M") for slot in _due_heartbeat_slots(times, since, now)]
+        if not stamps:
             return
 
         recipients = set()
@@ -555,28 +813,140 @@ def maybe_send_heartbeat(cfg):
         if not recipients:
             return
 
+        # 送信前に枠を確保（他プロセスが確保済みの枠は除く）
+        stamps = [st for st in stamps if _claim_heartbeat_slot(st)]
+        if not stamps:
+            return
+        # 判定に使うのは直近分だけなので、1日より前の枠は捨てる
+        _prune_heartbeat_claims(keep_from=(now - timedelta(days=1)).strftime("%Y%m%d%H%M"))
+
         subj = f"【死活監視】雨監視システム稼働中 - {now:%Y/%m/%d %H:%M}"
         body = (
             f"システムは稼働中です。\n\n"
             f"時刻: {now:%Y/%m/%d %H:%M}\n"
             f"監視地点数: {len(locations or [cfg.get('location')])}\n"
-            f"間隔: {cfg.get('monitoring',{}).get('interval_minutes', 3)} 分\n"
+            f"間隔: {effective_interval_minutes(cfg.get('monitoring',{}).get('interval_minutes', 5))} 分\n"
         )
 
-        stamp = now.strftime("%Y%m%d%H%M")
-        flag_file = os.path.join("logs", f"heartbeat_{stamp}.flag")
-        os.makedirs("logs", exist_ok=True)
-        if not os.path.exists(flag_file):
-            for email in recipients:
-                send_email(email, subj, body)
-            log_message(f"死活監視通知を {len(recipients)} 件送信: {', '.join(recipients)}")
-            open(flag_file, "w").close()
+        sent_to = [email for email in recipients if send_email(email, subj, body)]
+        if not sent_to:
+            # 全宛先に失敗したら枠を手放し、次回チェックでも同じ時間帯を見直して再送する
+            for st in stamps:
+                _release_heartbeat_slot(st)
+            _heartbeat_last_check = since
+            log_message("[ERROR] 死活監視通知の送信に失敗。次回チェックで再送します")
+            return
+        log_message(f"死活監視通知を {len(sent_to)} 件送信: {', '.join(sent_to)}")
     except Exception as e:
         log_message(f"[ERROR] ハートビート送信エラー: {e}")
 
 # ───────────────────────────────────────────
-def check_and_notify():
-    """降水量チェックと通知"""
+def process_location(api: JMANowcastAPI, loc: Dict[str, Any], cfg: Dict[str, Any],
+                     times_main: Tuple[str,str], times_fixed: Dict[int, Tuple[str,str]]):
+    """1地点分の降水量取得・ログ出力・通知。
+    times_main は lead_minutes 用、times_fixed は 0/15/30/60 分用に固定した (basetime, validtime)（全地点で共通）
+    """
+    debug_mode = cfg.get("debug", False)
+    try:
+        loc_name = loc.get("name", "(無名)")
+        lat = float(loc["lat"])
+        lon = float(loc["lon"])
+        heavy = float(loc.get("heavy_rain", 30))
+        torrential = float(loc.get("torrential_rain", 50))
+        email_to = loc.get("email_to", "")
+        notification_enabled = bool(loc.get("notification_enabled", True))
+    except Exception:
+        return
+
+    # 現在の lead_minutes でメイン値（先読みと同じ時刻を使う）
+    bt_main, vt_main = times_main
+
+    # 地点の座標計算は1回だけ（以降の rainfall_mm_at に渡す）
+    xt, yt, px, py = api._tilepix(lat, lon)
+    geo = {"xt": xt, "yt": yt, "px": px, "py": py, "loc_name": loc_name}
+
+    rain, vt_jst, png_url = api.rainfall_mm_at(lat, lon, bt_main, vt_main, **geo)
+    
+    # デバッグ画像のファイル名を生成
+    ts = datetime.now().strftime('%Y%m%d_%H%M%S')
+    debug_filename = f"tile_{ts}_{vt_main}_max_2x2_z{api.zoom}_x{xt}_y{yt}_px{px}_py{py}.png"
+
+    # プレビュー（固定時刻での1px値。MAX窓の比較と重複するため log.preview=true の時のみ）
+    if cfg.get("log", {}).get("preview", False):
+        try:
+            preview_results = api.rainfalls_multi(lat, lon, times_fixed, **geo)
+            msg = f"【地点: {loc_name}】時刻別降水量: " + ", ".join(
+                [f"{('現在' if lm==0 else str(lm)+'分後')} {r:.1f}mm/h({t.strftime('%H:%M')})" for lm, r, t in preview_results]
+            )
+            log_message(msg)
+        except Exception:
+            pass
+
+    # MAX窓の比較（固定時刻）
+    try:
+        def summarize(method: str):
+            return ", ".join(
+                f"{('現在' if lm==0 else str(lm)+'分後')} {r:.1f}mm/h({t_jst.strftime('%H:%M')})"
+                for lm, r, t_jst in api.rainfalls_multi(lat, lon, times_fixed, method=method, **geo)
+            )
+        log_message(f"[地点: {loc_name}] MAX2x2: {summarize('max_2x2')}")
+        log_message(f"[地点: {loc_name}] MAX4x4: {summarize('max_4x4')}")
+        log_message(f"[地点: {loc_name}] MAX8x8: {summarize('max_8x8')}")
+    except Exception:
+        pass
+
+    # デバッグ: 精度比較
+    if debug_mode:
+        try:
+            log_message(f"[{loc_name}] === 精度比較実験 ===")
+            methods = [
+                ("single", "1px"),
+                ("high_zoom", "zoom+1"),
+                ("average_2x2", "2x2平均")
+            ]
+            for method, label in methods:
+                r_exp, _, _ = api.rainfall_mm_at(lat, lon, bt_main, vt_main, method=method, **geo)
+                log_message(f"[{loc_name}] {label}: {r_exp:.1f} mm/h")
+            log_message(f"[{loc_name}] === 比較終了 ===")
+        except Exception as e:
+            log_message(f"[{loc_name}] 精度比較エラー: {e}")
+
+    if png_url == "N/A":
+        log_message(f"[WARNING] [{loc_name}] データ取得失敗。次回再試行します。")
+        return
+
+    log_message(f"[{loc_name}] デバッグ画像: debug_images/{debug_filename}")
+    log_message(f"[{loc_name}] 降水量 ({vt_jst.strftime('%H:%M')} JST): {rain:.1f} mm/h")
+
+    level = "豪雨" if rain >= torrential else "大雨" if rain >= heavy else None
+    if not level:
+        log_message(f"[{loc_name}] 異常なし（閾値: 大雨{heavy}mm/h, 豪雨{torrential}mm/h）")
+        return
+
+    if notification_enabled and email_to:
+        subj = f"【{level}警報】{loc_name}周辺 - {datetime.now():%m/%d %H:%M}"
+        body = (
+            f"{loc_name} 周辺で {level} が予測されています。\n\n"
+            f"降水量 ({vt_jst.strftime('%H:%M')} JST): {rain:.1f} mm/h\n"
+            f"警報レベル: {level} (閾値: 大雨{heavy}mm/h, 豪雨{torrential}mm/h)\n"
+            f"デバッグ画像: {debug_filename}\n"
+            f"確認時刻: {datetime.now():%Y/%m/%d %H:%M}\n\n"
+            "データソース: 気象庁 高解像度降水ナウキャスト"
+        )
+        sent_to = []
+        for addr in parse_email_list(email_to):
+            send_email(addr, subj, body)
+            sent_to.append(addr)
+        if sent_to:
+            log_message(f"[{loc_name}] {level}検知 → {', '.join(sent_to)} に通知送信")
+    else:
+        log_message(f"[{loc_name}] {level}検知（通知設定なし: enabled={notification_enabled}, email='{email_to}'）")
+
+# ───────────────────────────────────────────
+def check_and_notify(api: Optional[JMANowcastAPI] = None) -> bool:
+    """降水量チェックと通知。処理全体が完走すれば True。
+    api を渡すとそれを使い回す（常駐ワーカーではタイル/時刻キャッシュを周期をまたいで再利用）。
+    """
     try:
         cfg = load_config()
         debug_mode = cfg.get("debug", False)
@@ -587,7 +957,14 @@ def check_and_notify():
 
         maybe_send_heartbeat(cfg)
 
-        api = JMANowcastAPI(zoom=10, debug=debug_mode)
+        dbg_img_cfg = cfg.get("debug_images", {}) if isinstance(cfg, dict) else {}
+        save_debug_images = bool(dbg_img_cfg.get("enabled", True))
+        if api is None:
+            api = JMANowcastAPI(zoom=10, debug=debug_mode, save_debug_images=save_debug_images)
+        else:
+            # 設定の変更は毎周期反映する
+            api.debug = debug_mode
+            api.save_debug_images = save_debug_images
         log_message(f"予測オフセット: {lead_minutes} 分先を参照")
 
         # 互換: locations がなければ location を1件として扱う
@@ -612,127 +989,64 @@ def check_and_notify():
                 "notification_enabled": True
             }]
 
+        # 0/15/30/60 分用の basetime/validtime を先に固定（全地点で共通）
+        times_fixed: Dict[int, Tuple[str,str]] = {}
+        for lm in [0, 15, 30, 60]:
+            times_fixed[lm] = api._latest_times(target_offset_minutes=lm)
+        times_main = api._latest_times(target_offset_minutes=lead_minutes)
+
+        # 全地点×全時刻で使うタイルを重複なしでまとめて並列に先読み（各地点の処理はキャッシュから読む）
+        tile_keys = []
         for loc in locations:
             try:
-                loc_name = loc.get("name", "(無名)")
-                lat = float(loc["lat"])
-                lon = float(loc["lon"])
-                heavy = float(loc.get("heavy_rain", 30))
-                torrential = float(loc.get("torrential_rain", 50))
-                email_to = loc.get("email_to", "")
-                notification_enabled = bool(loc.get("notification_enabled", True))
+                xt, yt, _, _ = api._tilepix(float(loc["lat"]), float(loc["lon"]))
             except Exception:
                 continue
+            tile_keys += [(bt, vt, xt, yt) for bt, vt in [times_main, *times_fixed.values()]]
+        api.fetch_many(tile_keys)
+
+        # 地点ごとの処理は独立（I/O待ちが主）なのでスレッドで並列実行
+        with ThreadPoolExecutor(max_workers=min(8, len(locations))) as ex:
+            list(ex.map(lambda loc: process_location(api, loc, cfg, times_main, times_fixed), locations))
+
+        # デバッグ画像の自動クリーンアップ（全地点の処理後に1回だけ）
+        prune_debug_images(
+            retention_hours=int(dbg_img_cfg.get("retention_hours", 12)),
+            max_files=int(dbg_img_cfg.get("max_files", 500)),
+            max_total_mb=int(dbg_img_cfg.get("max_total_mb", 200)),
+        )
+        return True
 
-            # 0/15/30/60 分用の basetime/validtime を先に固定
-            leads_preview = [0, 15, 30, 60]
-            times_fixed: Dict[int, Tuple[str,str]] = {}
-            for lm in leads_preview:
-                times_fixed[lm] = api._latest_times(target_offset_minutes=lm)
-
-            # 現在の lead_minutes でメイン値
-            bt_main, vt_main = api._latest_times(target_offset_minutes=lead_minutes)
-            rain, vt_jst, png_url = api.rainfall_mm_at(lat, lon, bt_main, vt_main)
-            
-            # デバッグ画像のファイル名を生成
-            ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-            xt, yt = api._deg2tile(lat, lon)
-            px, py = api._pixel_in_tile(lat, lon)
-            debug_filename = f"tile_{ts}_{vt_main}_max_2x2_z{api.zoom}_x{xt}_y{yt}_px{px}_py{py}.png"
-
-            # プレビュー（固定時刻での比較）
-            try:
-                preview_results = []
-                for lm in leads_preview:
-                    bt, vt = times_fixed[lm]
-                    r, t_jst, _ = api.rainfall_mm_at(lat, lon, bt, vt)
-                    preview_results.append((lm, r, t_jst))
-                msg = f"【地点: {loc_name}】時刻別降水量: " + ", ".join(
-                    [f"{('現在' if lm==0 else str(lm)+'分後')} {r:.1f}mm/h({t.strftime('%H:%M')})" for lm, r, t in preview_results]
-                )
-                log_message(msg)
-            except Exception:
-                pass
-
-            # MAX窓の比較（固定時刻）
-            try:
-                def summarize(method: str):
-                    vals = []
-                    for lm in leads_preview:
-                        bt, vt = times_fixed[lm]
-                        r, t_jst, _ = api.rainfall_mm_at(lat, lon, bt, vt, method=method)
-                        vals.append(f"{('現在' if lm==0 else str(lm)+'分後')} {r:.1f}mm/h({t_jst.strftime('%H:%M')})")
-                    return ", ".join(vals)
-                log_message(f"[地点: {loc_name}] MAX2x2: {summarize('max_2x2')}")
-                log_message(f"[地点: {loc_name}] MAX4x4: {summarize('max_4x4')}")
-                log_message(f"[地点: {loc_name}] MAX8x8: {summarize('max_8x8')}")
-            except Exception:
-                pass
+    except Exception as e:
+        log_message(f"[ERROR] チェック処理エラー: {e}")
+        return False
 
-            # デバッグ: 精度比較
-            if debug_mode:
-                try:
-                    log_message(f"[{loc_name}] === 精度比較実験 ===")
-                    methods = [
-                        ("single", "1px"),
-                        ("high_zoom", "zoom+1"),
-                        ("average_2x2", "2x2平均")
-                    ]
-                    for method, label in methods:
-                        r_exp, _, _ = api.rainfall_mm_at(lat, lon, bt_main, vt_main, method=method)
-                        log_message(f"[{loc_name}] {label}: {r_exp:.1f} mm/h")
-                    log_message(f"[{loc_name}] === 比較終了 ===")
-                except Exception as e:
-                    log_message(f"[{loc_name}] 精度比較エラー: {e}")
-        
-            if png_url == "N/A":
-                log_message(f"[WARNING] [{loc_name}] データ取得失敗。次回再試行します。")
-                continue
+def run_once() -> bool:
+    """1回だけチェックを実行（`--once` 相当）。UI からプロセス内で呼び出す用"""
+    return check_and_notify()
 
-            log_message(f"[{loc_name}] デバッグ画像: debug_images/{debug_filename}")
-            log_message(f"[{loc_name}] 降水量 ({vt_jst.strftime('%H:%M')} JST): {rain:.1f} mm/h")
+# ───────────────────────────────────────────
+JMA_PUBLISH_STEP_SEC = 300  # ナウキャストは5分ごとに更新される
 
-            level = "豪雨" if rain >= torrential else "大雨" if rain >= heavy else None
-            if not level:
-                log_message(f"[{loc_name}] 異常なし（閾値: 大雨{heavy}mm/h, 豪雨{torrential}mm/h）")
-                continue
+def effective_interval_minutes(interval_minutes: float) -> int:
+    """実際のチェック間隔（分）。5分更新に合わせるため5分単位に切り上げる（最短5分）"""
+    step_min = JMA_PUBLISH_STEP_SEC // 60
+    return step_min * max(1, math.ceil(float(interval_minutes) / step_min))
 
-            if notification_enabled and email_to:
-                subj = f"【{level}警報】{loc_name}周辺 - {datetime.now():%m/%d %H:%M}"
-                body = (
-                    f"{loc_name} 周辺で {level} が予測されています。\n\n"
-                    f"降水量 ({vt_jst.strftime('%H:%M')} JST): {rain:.1f} mm/h\n"
-                    f"警報レベル: {level} (閾値: 大雨{heavy}mm/h, 豪雨{torrential}mm/h)\n"
-                    f"デバッグ画像: {debug_filename}\n"
-                    f"確認時刻: {datetime.now():%Y/%m/%d %H:%M}\n\n"
-                    "データソース: 気象庁 高解像度降水ナウキャスト"
-                )
-                sent_to = []
-                for addr in parse_email_list(email_to):
-                    send_email(addr, subj, body)
-                    sent_to.append(addr)
-                if sent_to:
-                    log_message(f"[{loc_name}] {level}検知 → {', '.join(sent_to)} に通知送信")
-            else:
-                log_message(f"[{loc_name}] {level}検知（通知設定なし: enabled={notification_enabled}, email='{email_to}'）")
-
-            # デバッグ画像の自動クリーンアップ
-            dbg = cfg.get("debug_images", {}) if isinstance(cfg, dict) else {}
-            prune_debug_images(
-                retention_hours=int(dbg.get("retention_hours", 12)),
-                max_files=int(dbg.get("max_files", 500)),
-                max_total_mb=int(dbg.get("max_total_mb", 200)),
-            )
-        
-    except Exception as e:
-        log_message(f"[ERROR] チェック処理エラー: {e}")
+def _seconds_until_next_poll(interval_minutes: float) -> float:
+    """次回チェックまでの待ち秒数。直前の5分境界から effective_interval_minutes 後の境界（＋数秒の揺らぎ）に合わせる"""
+    now = time.time()
+    last_boundary = math.floor(now / JMA_PUBLISH_STEP_SEC) * JMA_PUBLISH_STEP_SEC
+    next_boundary = last_boundary + effective_interval_minutes(interval_minutes) * 60
+    # 公開直後のアクセス集中と配信遅延を避けるため境界から少し遅らせる
+    return max(1.0, next_boundary + random.uniform(5, 15) - now)
 
 # ───────────────────────────────────────────
 def main():
     # コマンドライン引数処理
     if len(sys.argv) > 1:
         if sys.argv[1] == "--once":
-            check_and_notify()
+            run_once()
             return
         elif sys.argv[1] == "--debug":
             cfg = load_config()
@@ -782,33 +1096,48 @@ def main():
             log_message("=== 全地点の精度比較実験 完了 ===")
             return
 
-    # PID ファイル作成
+    # 既に別のワーカーが動いていれば二重起動しない（JMA へのアクセスが倍になるため）
+    other = read_pid(PID_PATH)
+    if other and other != os.getpid() and pid_alive(other):
+        log_message(f"[ERROR] 監視ワーカーは既に起動中です (PID {other})。終了します")
+        return
+
+    # PID ファイル作成（一時ファイルに書いてから置き換え、読み手に途中状態を見せない）
     try:
-        with open("monitor.pid", "w") as pf:
+        tmp = PID_PATH + ".tmp"
+        with open(tmp, "w") as pf:
             pf.write(str(os.getpid()))
+        os.replace(tmp, PID_PATH)
     except Exception:
         pass
 
     def _cleanup_pid(*_):
         try:
-            if os.path.exists("monitor.pid"):
-                os.remove("monitor.pid")
+            # 自分が書いた PID ファイルだけを消す
+            if read_pid(PID_PATH) == os.getpid():
+                os.remove(PID_PATH)
         except Exception:
             pass
 
     atexit.register(_cleanup_pid)
     try:
-        signal.signal(signal.SIGTERM, _cleanup_pid)
+        def _on_sigterm(*_):
+            # PID を消すだけで走り続けると、停止したはずのワーカーが残ってしまう
+            _cleanup_pid()
+            sys.exit(0)
+        signal.signal(signal.SIGTERM, _on_sigterm)
     except Exception:
         pass
 
+    _get_logger(rotate=True)  # ローテーションは常駐ワーカーだけが行う
     log_message("監視ワーカー起動")
+    api = JMANowcastAPI(zoom=10)  # 常駐中は1つを使い回す
     while True:
         try:
             cfg = load_config()
             if cfg["monitoring"]["enabled"]:
-                check_and_notify()
-                time.sleep(cfg["monitoring"]["interval_minutes"] * 60)
+                check_and_notify(api=api)
+                time.sleep(_seconds_until_next_poll(cfg["monitoring"]["interval_minutes"]))
             else:
                 log_message("監視停止中")
                 time.sleep(60)
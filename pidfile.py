@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+pidfile.py – 監視ワーカーの PID ファイルと生存確認（monitor.py / app.py で共有）
+  - 重い依存（requests/PIL など）を持たないので UI からも気軽に import できる
+"""
+
+import os
+from typing import Optional
+
+PID_PATH = "monitor.pid"
+
+def read_pid(path: str = PID_PATH) -> Optional[int]:
+    try:
+        with open(path, "r") as f:
+            return int(f.read().strip())
+    except Exception:
+        return None
+
+def pid_alive(pid: Optional[int]) -> bool:
+    """プロセスが生存しているか。Windows の os.kill(pid, 0) は終了シグナル扱いになるため使わない"""
+    if not pid:
+        return False
+    if os.name == "nt":
+        try:
+            import ctypes
+            k32 = ctypes.windll.kernel32
+            h = k32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+            if not h:
+                return False
+            try:
+                code = ctypes.c_ulong()
+                ok = k32.GetExitCodeProcess(h, ctypes.byref(code))
+                return bool(ok) and code.value == 259  # STILL_ACTIVE
+            finally:
+                k32.CloseHandle(h)
+        except Exception:
+            return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except PermissionError:
+        return True
+    except Exception:
+        return False
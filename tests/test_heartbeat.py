@@ -0,0 +1,50 @@
+from datetime import datetime
+
+import monitor
+
+CFG = {
+    "heartbeat": {"enabled": True, "times": ["08:03"]},
+    "locations": [{"name": "三島駅", "lat": 35.1, "lon": 138.9,
+                   "notification_enabled": True, "email_to": "ops@example.com"}],
+    "monitoring": {"interval_minutes": 5},
+}
+
+
+class _FixedNow(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2026, 1, 1, 8, 5, 10)
+
+
+def _setup(monkeypatch, tmp_path, results):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(monitor, "datetime", _FixedNow)
+    monkeypatch.setattr(monitor, "log_message", lambda msg: None)
+    sent = []
+
+    def fake_send(to_addr, subject, body):
+        sent.append(to_addr)
+        return results.pop(0) if results else True
+
+    monkeypatch.setattr(monitor, "send_email", fake_send)
+    return sent
+
+
+def test_slot_is_sent_once_across_processes(monkeypatch, tmp_path):
+    sent = _setup(monkeypatch, tmp_path, [])
+    for _ in range(2):
+        # 別プロセス相当: 前回判定時刻を持たない状態で、同じ時間帯を判定する
+        monkeypatch.setattr(monitor, "_heartbeat_last_check", datetime(2026, 1, 1, 8, 0, 10))
+        monitor.maybe_send_heartbeat(CFG)
+
+    assert sent == ["ops@example.com"]
+
+
+def test_failed_send_is_retried(monkeypatch, tmp_path):
+    sent = _setup(monkeypatch, tmp_path, [False, True])
+    monkeypatch.setattr(monitor, "_heartbeat_last_check", datetime(2026, 1, 1, 8, 0, 10))
+    monitor.maybe_send_heartbeat(CFG)
+    monitor.maybe_send_heartbeat(CFG)
+    monitor.maybe_send_heartbeat(CFG)
+
+    assert sent == ["ops@example.com", "ops@example.com"]
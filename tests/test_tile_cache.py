@@ -0,0 +1,38 @@
+from PIL import Image
+
+import monitor
+
+
+def _api_counting_downloads(monkeypatch, tile_cache_max):
+    api = monitor.JMANowcastAPI(zoom=10, tile_cache_max=tile_cache_max)
+    calls = []
+
+    def fake_download(basetime, validtime, x, y, zoom):
+        calls.append((basetime, validtime, zoom, x, y))
+        return Image.new("RGBA", (256, 256)), f"https://example.invalid/{zoom}/{x}/{y}.png"
+
+    monkeypatch.setattr(api, "_download_tile_png", fake_download)
+    return api, calls
+
+
+def test_batch_larger_than_cap_is_not_downloaded_twice(monkeypatch):
+    api, calls = _api_counting_downloads(monkeypatch, tile_cache_max=4)
+    keys = [("20250811033000", vt, 900 + i, 400) for i in range(6)
+            for vt in ("20250811033000", "20250811040000")]
+
+    assert api.fetch_many(keys + keys[:3]) == len(keys)  # 重複は1回だけ取得
+    for bt, vt, x, y in keys:
+        api._fetch_tile_png(bt, vt, x, y)
+
+    assert len(calls) == len(keys)
+    assert len(set(calls)) == len(keys)
+
+
+def test_cache_evicts_beyond_configured_cap(monkeypatch):
+    api, calls = _api_counting_downloads(monkeypatch, tile_cache_max=2)
+    for x in range(3):
+        api._fetch_tile_png("bt", "vt", x, 0)
+    api._fetch_tile_png("bt", "vt", 0, 0)  # 最も古いものは追い出されている
+
+    assert len(calls) == 4
+    assert api.tile_cache_max == 2